@@ -0,0 +1,143 @@
+"""Нормализация свободного ввода названия банка: 'Сбер', 'сбербанк', 'Сбербанк России' -> 'Сбербанк'.
+
+Нечёткое сопоставление выполняется только для уникальных значений, которых ещё нет
+в постоянном словаре raw -> canonical. Колонка перекодируется одной операцией над
+кодами category, без прохода по строкам.
+"""
+import json
+import os
+import re
+import threading
+from difflib import SequenceMatcher, get_close_matches
+
+import numpy as np
+import pandas as pd
+
+# Каноническое название -> известные варианты написания
+KNOWN_BANKS = {
+    'Сбербанк': ['сбер', 'сбербанк россии', 'sber', 'sberbank', 'сбер банк'],
+    'ВТБ': ['втб 24', 'втб24', 'vtb'],
+    'Альфа-Банк': ['альфа', 'альфабанк', 'alfa', 'alfa bank'],
+    'Т-Банк': ['тинькофф', 'тинькоф', 'тиньков', 'tinkoff', 't bank'],
+    'Газпромбанк': ['газпром', 'гпб'],
+    'Россельхозбанк': ['россельхоз', 'рсхб'],
+    'Райффайзенбанк': ['райффайзен', 'райфайзен', 'raiffeisen'],
+    'Совкомбанк': ['совком'],
+    'Почта Банк': ['почта'],
+    'Промсвязьбанк': ['псб', 'промсвязь'],
+    'Росбанк': [],
+    'Открытие': [],
+    'Уралсиб': [],
+    'МКБ': ['московский кредитный'],
+    'Kaspi Bank': ['kaspi', 'каспи', 'каспий'],
+    'Halyk Bank': ['halyk', 'халык', 'народный'],
+    'Jusan Bank': ['jusan', 'жусан'],
+    'Forte Bank': ['forte', 'форте'],
+    'Банк ЦентрКредит': ['бцк', 'bcc', 'центркредит'],
+}
+
+# Слова, которые не отличают один банк от другого
+_BANK_WORDS = ('банк', 'bank')
+_NOISE_WORDS = {'банк', 'bank', 'пао', 'ао', 'оао', 'зао', 'ооо', 'jsc', 'ltd', 'отделение', 'россии', 'рф', 'казахстан'}
+
+
+def name_key(raw):
+    """Ключ для сравнения: нижний регистр, без кавычек, орг. форм и слова 'банк'"""
+    text = str(raw).lower().replace('ё', 'е')
+    text = re.sub(r'[^\w ]+', ' ', text)
+    words = text.split()
+    key = ' '.join(w for w in words if w not in _NOISE_WORDS)
+    # 'сбербанк' и 'сбер банк' - одно и то же
+    key = re.sub(r'(?<=\w)\s*(bank|банк)$', '', key) or key
+    # 'Т-Банк' без слова 'банк' - одна буква, такой ключ совпал бы с чем угодно: оставляем слово целиком
+    if 0 < len(key) < 3:
+        key = ''.join(words)
+    return key
+
+
+def _misspelled_bank_word(tail):
+    """'банг', 'бнк' - опечатка в слове 'банк' после названия"""
+    return any(SequenceMatcher(None, tail, word).ratio() >= 0.75 for word in _BANK_WORDS)
+
+
+class BankNormalizer:
+    """Постоянный словарь raw -> canonical с нечётким поиском для новых значений"""
+
+    def __init__(self, path=None, cutoff=0.8):
+        self.path = path
+        self.cutoff = cutoff
+        self.mapping = {}
+        self._dirty = False
+        self._aliases = {}
+        # Загрузка опросов идёт в потоках - словарь и файл меняются под блокировкой
+        self._lock = threading.Lock()
+        for canonical, variants in KNOWN_BANKS.items():
+            self._add_alias(canonical, canonical)
+            for variant in variants:
+                self._add_alias(variant, canonical)
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.mapping = json.load(f)
+            for raw, canonical in self.mapping.items():
+                self._add_alias(canonical, canonical)
+                self._add_alias(raw, canonical)
+
+    def _add_alias(self, name, canonical):
+        key = name_key(name)
+        if key:
+            self._aliases.setdefault(key, canonical)
+
+    def _match(self, raw):
+        key = name_key(raw)
+        if not key:
+            return str(raw).strip()
+        if key in self._aliases:
+            return self._aliases[key]
+        # 'сбербанк онлайн', 'втб на ленина' - ищем известное название среди слов
+        for word in key.split():
+            word = name_key(word)
+            if len(word) >= 3 and word in self._aliases:
+                return self._aliases[word]
+        # 'сбербанг', 'альфабнк' - опечатка в слове 'банк' после известного названия;
+        # другой хвост ('газпромнефть') - это другое название, а не опечатка
+        prefixes = [alias for alias in self._aliases
+                    if len(alias) >= 4 and key.startswith(alias) and _misspelled_bank_word(key[len(alias):])]
+        if prefixes:
+            return self._aliases[max(prefixes, key=len)]
+        match = get_close_matches(key, list(self._aliases), n=1, cutoff=self.cutoff)
+        if match:
+            return self._aliases[match[0]]
+        # Новый банк: он сам становится каноническим названием для следующих вариантов
+        canonical = ' '.join(str(raw).split())
+        canonical = canonical[:1].upper() + canonical[1:]
+        self._add_alias(canonical, canonical)
+        return canonical
+
+    def canonical(self, raw):
+        raw = str(raw)
+        if raw not in self.mapping:
+            self.mapping[raw] = self._match(raw)
+            self._dirty = True
+        return self.mapping[raw]
+
+    def normalize(self, series):
+        """Категориальная колонка с каноническими названиями (пропуски сохраняются)"""
+        values = series.astype('category')
+        with self._lock:
+            canonical = [self.canonical(raw) for raw in values.cat.categories]
+        categories = pd.Index(canonical).unique()
+        code_map = categories.get_indexer(canonical)
+        codes = values.cat.codes.to_numpy()
+        new_codes = np.where(codes >= 0, code_map[codes], -1)
+        return pd.Series(pd.Categorical.from_codes(new_codes, categories), index=series.index, name=series.name)
+
+    def save(self):
+        """Записывает словарь, если появились новые значения"""
+        with self._lock:
+            if not self.path or not self._dirty:
+                return
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.mapping, f, ensure_ascii=False, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+            self._dirty = False
@@ -0,0 +1,116 @@
+"""Бенчмарк рендера графиков: прежние plot_* (pyplot + tight_layout + bbox_inches='tight')
+против ChartRenderer. Печатает графики в секунду на одно ядро и средний размер картинки.
+
+    python bench_charts.py [количество_рендеров]
+"""
+import io
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import pandas as pd
+import seaborn as sns
+
+from charts import ChartRenderer
+from fakes import sample_records
+
+GENDER = "Укажите ваш пол."
+AGE = "Укажите ваш возраст."
+BANK = "Назовите банк, отделение которого вы посещали недавно."
+
+
+def legacy_plot_pie(df, column, title):
+    plt.style.use('seaborn-v0_8-darkgrid')
+    data = df[column].value_counts()
+    labels = [str(x)[:18] + ('...' if len(str(x)) > 18 else '') for x in data.index]
+    colors = sns.color_palette('Set3', len(data))
+    plt.figure(figsize=(5, 5))
+    plt.pie(data.values, labels=labels, autopct='%1.1f%%', startangle=140, colors=colors,
+            textprops={'fontsize': 12, 'fontweight': 'bold'}, wedgeprops={'edgecolor': 'white'})
+    plt.title(f'🟢 {title}', fontsize=17, fontweight='bold', pad=15)
+    plt.tight_layout()
+    buf = io.BytesIO()
+    plt.savefig(buf, format='png', dpi=180, bbox_inches='tight')
+    plt.close()
+    buf.seek(0)
+    return buf
+
+
+def legacy_plot_hist(df, column, title):
+    plt.style.use('seaborn-v0_8-darkgrid')
+    data = pd.to_numeric(df[column].astype(str).str.extract(r'(\d+)')[0], errors='coerce').dropna()
+    plt.figure(figsize=(8, 5))
+    ax = sns.histplot(data, bins=range(int(data.min()), int(data.max())+5, 5), color='#4C72B0', edgecolor='black', alpha=0.85)
+    ax.set_title(f'📈 {title}', fontsize=17, fontweight='bold', pad=15)
+    ax.set_xlabel(column, fontsize=13, fontweight='bold')
+    ax.set_ylabel('Количество', fontsize=13, fontweight='bold')
+    plt.xticks(fontsize=11)
+    plt.yticks(fontsize=11)
+    sns.despine()
+    plt.tight_layout()
+    buf = io.BytesIO()
+    plt.savefig(buf, format='png', dpi=180, bbox_inches='tight')
+    plt.close()
+    buf.seek(0)
+    return buf
+
+
+def legacy_plot_bar(df, column, title):
+    plt.style.use('seaborn-v0_8-darkgrid')
+    plt.figure(figsize=(9, 5))
+    data = df[column].value_counts()
+    labels = [str(x)[:18] + ('...' if len(str(x)) > 18 else '') for x in data.index]
+    ax = sns.barplot(x=labels, y=data.values, palette='Set2', edgecolor='black')
+    ax.set_title(f'📊 {title}', fontsize=18, fontweight='bold', pad=15)
+    ax.set_xlabel(column, fontsize=13, fontweight='bold')
+    ax.set_ylabel('Количество', fontsize=13, fontweight='bold')
+    plt.xticks(rotation=30, ha='right', fontsize=11)
+    plt.yticks(fontsize=11)
+    for i, v in enumerate(data.values):
+        ax.text(i, v + max(data.values)*0.01, str(v), ha='center', va='bottom', fontsize=11, fontweight='bold', color='#333')
+    sns.despine()
+    plt.tight_layout()
+    buf = io.BytesIO()
+    plt.savefig(buf, format='png', dpi=180, bbox_inches='tight')
+    plt.close()
+    buf.seek(0)
+    return buf
+
+
+def bench(fn, n):
+    fn()  # прогрев (шрифты, шаблоны)
+    total_bytes = 0
+    start = time.process_time()
+    for _ in range(n):
+        total_bytes += len(fn().getvalue())
+    elapsed = time.process_time() - start
+    return n / elapsed, total_bytes / n
+
+
+def main():
+    import warnings
+    warnings.filterwarnings('ignore')  # нет глифов эмодзи в шрифте по умолчанию
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    df = pd.DataFrame(sample_records(1000))
+    renderer = ChartRenderer()
+    ages = pd.to_numeric(df[AGE]).values
+    cases = [
+        ('pie', lambda: legacy_plot_pie(df, GENDER, 'Гендерный состав'),
+                lambda: renderer.pie(df[GENDER].value_counts(), 'Гендерный состав')),
+        ('hist', lambda: legacy_plot_hist(df, AGE, 'Распределение по возрасту'),
+                 lambda: renderer.hist(ages, 'Распределение по возрасту', AGE)),
+        ('bar', lambda: legacy_plot_bar(df, BANK, 'Топ банков'),
+                lambda: renderer.bar(df[BANK].value_counts(), 'Топ банков', BANK)),
+    ]
+    print(f"{'график':<6} {'было, шт/с':>11} {'стало, шт/с':>12} {'ускорение':>10} {'было, КБ':>9} {'стало, КБ':>10}")
+    for name, legacy, new in cases:
+        old_rate, old_bytes = bench(legacy, n)
+        new_rate, new_bytes = bench(new, n)
+        print(f"{name:<6} {old_rate:>11.1f} {new_rate:>12.1f} {new_rate / old_rate:>9.1f}x "
+              f"{old_bytes / 1024:>9.0f} {new_bytes / 1024:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
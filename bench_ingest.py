@@ -0,0 +1,54 @@
+"""Бенчмарк загрузки опроса: get_all_records() + pd.DataFrame против постраничной
+загрузки в колонки (sheetload.py), обе - с типизацией по схеме. Печатает строки в секунду,
+пик памяти (tracemalloc) и размер итогового DataFrame.
+
+    python bench_ingest.py [строк] [строк_в_запросе]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+from fakes import FakeWorksheet, sample_records
+from schema import apply_schema, parse_timestamps
+from sheetload import read_worksheet
+
+
+def legacy_load(sheet):
+    return pd.DataFrame(sheet.get_all_records())
+
+
+def measure(load, sheet, hints, scales):
+    tracemalloc.start()
+    start = time.perf_counter()
+    df, _ = apply_schema(load(sheet), hints=hints, scales=scales)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return df, len(df) / elapsed, peak, df.memory_usage(deep=True).sum()
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    batch_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    os.environ.setdefault('OPENAI_API_KEY', 'bench')
+    from test import ORDINAL_SCALES, SCHEMA_HINTS, TIMESTAMP_COLUMN
+
+    sheet = FakeWorksheet(sample_records(rows))
+    cases = [
+        ('get_all_records', legacy_load),
+        (f'по {batch_rows} строк', lambda s: read_worksheet(s, batch_rows, {TIMESTAMP_COLUMN: parse_timestamps})),
+    ]
+    results = []
+    for name, load in cases:
+        df, rate, peak, size = measure(load, sheet, SCHEMA_HINTS, ORDINAL_SCALES)
+        results.append(df)
+        print(f"{name:<18} {rate:>9.0f} строк/с, пик {peak / 2**20:>7.1f} МБ, "
+              f"итог {size / 2**20:>5.1f} МБ (пик/итог {peak / size:.1f}x)")
+    pd.testing.assert_frame_equal(results[0], results[1])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""Быстрый рендер графиков: заранее оформленные шаблоны фигур и адаптивный размер картинки.
+
+Шаблон (фигура, оси, стиль, подписи осей) создаётся один раз на поток и тип графика,
+при каждом рендере перерисовываются только данные. Раскладка фиксированная, поэтому
+не нужны ни tight_layout, ни bbox_inches='tight' (второй проход раскладки при сохранении).
+Telegram всё равно пережимает фото, поэтому dpi подбирается под ширину экрана телефона,
+а PNG заменяется на JPEG, если он получается слишком тяжёлым.
+"""
+import io
+import textwrap
+import threading
+
+import matplotlib
+import matplotlib.dates as mdates
+import matplotlib.style
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+
+STYLE = 'seaborn-v0_8-darkgrid'
+
+# Размер (дюймы) и поля фигуры для каждого типа графика
+TEMPLATES = {
+    # Подписи долей (до 21 символа) стоят по бокам круга - фигура шире, чем круг
+    'pie': {'figsize': (9, 5.5), 'margins': dict(left=0.02, right=0.98, bottom=0.04, top=0.86)},
+    'hist': {'figsize': (8, 5), 'margins': dict(left=0.1, right=0.97, bottom=0.16, top=0.88)},
+    'bar': {'figsize': (9, 5), 'margins': dict(left=0.09, right=0.98, bottom=0.33, top=0.88)},
+    'line': {'figsize': (8, 5), 'margins': dict(left=0.1, right=0.97, bottom=0.16, top=0.88)},
+}
+
+
+def short_label(value, limit=18):
+    text = str(value)
+    return text[:limit] + ('...' if len(text) > limit else '')
+
+
+def palette(name, n):
+    """Аналог sns.color_palette(name, n) для качественных палитр"""
+    colors = matplotlib.colormaps[name].colors
+    return [colors[i % len(colors)] for i in range(n)]
+
+
+class _Template:
+    def __init__(self, kind, dpi):
+        spec = TEMPLATES[kind]
+        with matplotlib.style.context(STYLE):
+            self.fig = Figure(figsize=spec['figsize'], dpi=dpi)
+            FigureCanvasAgg(self.fig)
+            self.ax = self.fig.add_subplot()
+        self.fig.subplots_adjust(**spec['margins'])
+        self.ax.spines[['top', 'right']].set_visible(False)
+        self.ax.tick_params(labelsize=11)
+        self.artists = []
+
+    def clear_data(self):
+        for artist in self.artists:
+            artist.remove()
+        self.artists = []
+
+
+class ChartRenderer:
+    """Рендерит pie/hist/bar в BytesIO, переиспользуя шаблоны фигур"""
+
+    def __init__(self, target_width=1080, max_dpi=180, max_bytes=200_000, jpeg_quality=85):
+        self.target_width = target_width
+        self.max_dpi = max_dpi
+        self.max_bytes = max_bytes
+        self.jpeg_quality = jpeg_quality
+        self._local = threading.local()
+
+    def dpi_for(self, kind):
+        width_in = TEMPLATES[kind]['figsize'][0]
+        return max(72, min(self.max_dpi, self.target_width / width_in))
+
+    def _template(self, kind):
+        templates = getattr(self._local, 'templates', None)
+        if templates is None:
+            templates = self._local.templates = {}
+        if kind not in templates:
+            templates[kind] = _Template(kind, self.dpi_for(kind))
+        template = templates[kind]
+        template.clear_data()
+        return template
+
+    def _encode(self, fig):
+        canvas = fig.canvas
+        canvas.draw()
+        width, height = canvas.get_width_height()
+        image = Image.frombuffer('RGBA', (width, height), canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1).convert('RGB')
+        buf = io.BytesIO()
+        image.save(buf, format='PNG', compress_level=6)
+        buf.name = 'chart.png'
+        if buf.tell() > self.max_bytes:
+            jpeg = io.BytesIO()
+            image.save(jpeg, format='JPEG', quality=self.jpeg_quality, optimize=True)
+            jpeg.name = 'chart.jpg'
+            if jpeg.tell() < buf.tell():
+                buf = jpeg
+        buf.seek(0)
+        return buf
+
+    def pie(self, counts, title):
+        """counts - pd.Series с количеством ответов (как value_counts())"""
+        t = self._template('pie')
+        wedges, texts, autotexts = t.ax.pie(
+            counts.values,
+            labels=[short_label(x) for x in counts.index],
+            autopct='%1.1f%%',
+            startangle=140,
+            colors=palette('Set3', len(counts)),
+            textprops={'fontsize': 12, 'fontweight': 'bold'},
+            wedgeprops={'edgecolor': 'white'}
+        )
+        t.artists = [*wedges, *texts, *autotexts]
+        t.ax.set_title(f'🟢 {title}', fontsize=17, fontweight='bold', pad=15)
+        return self._encode(t.fig)
+
+    def hist(self, values, title, xlabel, bin_width=5):
+        """values - числовой массив без пропусков"""
+        t = self._template('hist')
+        values = np.asarray(values, dtype=float)
+        edges = np.arange(int(values.min()), int(values.max()) + bin_width, bin_width)
+        counts, edges = np.histogram(values, bins=edges)
+        bars = t.ax.bar(edges[:-1], counts, width=np.diff(edges), align='edge',
+                        color='#4C72B0', edgecolor='black', alpha=0.85)
+        t.artists = [bars]
+        t.ax.relim()
+        t.ax.autoscale_view()
+        t.ax.set_title(f'📈 {title}', fontsize=17, fontweight='bold', pad=15)
+        t.ax.set_xlabel(textwrap.fill(xlabel, 70), fontsize=13, fontweight='bold')
+        t.ax.set_ylabel('Количество', fontsize=13, fontweight='bold')
+        return self._encode(t.fig)
+
+    def bar(self, counts, title, xlabel):
+        """counts - pd.Series с количеством ответов (как value_counts())"""
+        t = self._template('bar')
+        values = np.asarray(counts.values)
+        positions = np.arange(len(values))
+        bars = t.ax.bar(positions, values, width=0.8, color=palette('Set2', len(values)), edgecolor='black')
+        t.artists = [bars]
+        # Подписи значений
+        offset = values.max() * 0.01 if len(values) else 0
+        for i, v in enumerate(values):
+            t.artists.append(t.ax.text(i, v + offset, str(v), ha='center', va='bottom',
+                                       fontsize=11, fontweight='bold', color='#333'))
+        t.ax.set_xticks(positions, [short_label(x) for x in counts.index], rotation=30, ha='right', fontsize=11)
+        t.ax.relim()
+        t.ax.autoscale_view()
+        t.ax.set_title(f'📊 {title}', fontsize=18, fontweight='bold', pad=15)
+        t.ax.set_xlabel(textwrap.fill(xlabel, 80), fontsize=13, fontweight='bold')
+        t.ax.set_ylabel('Количество', fontsize=13, fontweight='bold')
+        return self._encode(t.fig)
+
+    def line(self, values, title, ylabel, percent=False):
+        """values - pd.Series с DatetimeIndex (ряд динамики)"""
+        t = self._template('line')
+        lines = t.ax.plot(values.index, values.values, color='#4C72B0', linewidth=2.5, marker='o', markersize=5)
+        t.artists = list(lines)
+        # Шаблон общий для всех рядов: set_ylim прошлого процентного графика отключил автомасштаб
+        t.ax.autoscale(enable=True, axis='y')
+        t.ax.relim()
+        t.ax.autoscale_view()
+        if percent:
+            t.ax.set_ylim(0, 105)
+        t.ax.xaxis.set_major_formatter(mdates.DateFormatter('%d.%m'))
+        t.ax.set_title(f'📉 {title}', fontsize=17, fontweight='bold', pad=15)
+        t.ax.set_xlabel('Дата', fontsize=13, fontweight='bold')
+        t.ax.set_ylabel(ylabel, fontsize=13, fontweight='bold')
+        return self._encode(t.fig)
+
+    def dashboard(self, title, gender, ages, banks, waiting, scorecard, summary, width=2048):
+        """Сводная фигура из шести панелей по готовым агрегатам
+
+        gender, banks, waiting - pd.Series с количеством ответов; ages - pd.Series возраст -> количество;
+        scorecard - [(метрика, доля, нижняя, верхняя граница интервала)]; summary - строки ключевых цифр.
+        Фигура не переиспользуется: дашборд кэшируется готовой картинкой.
+        """
+        figsize = (16, 9)
+        with matplotlib.style.context(STYLE):
+            fig = Figure(figsize=figsize, dpi=min(self.max_dpi, width / figsize[0]))
+            FigureCanvasAgg(fig)
+            axes = fig.subplots(2, 3)
+        fig.subplots_adjust(left=0.05, right=0.98, bottom=0.12, top=0.88, wspace=0.38, hspace=0.55)
+        fig.suptitle(title, fontsize=20, fontweight='bold')
+        for ax in axes.flat:
+            ax.spines[['top', 'right']].set_visible(False)
+            ax.tick_params(labelsize=10)
+
+        ax = axes[0, 0]
+        if len(gender):
+            ax.pie(gender.values, labels=[short_label(x) for x in gender.index], autopct='%1.1f%%',
+                   startangle=140, colors=palette('Set3', len(gender)),
+                   textprops={'fontsize': 11, 'fontweight': 'bold'}, wedgeprops={'edgecolor': 'white'})
+        ax.set_title('Пол', fontsize=14, fontweight='bold')
+
+        ax = axes[0, 1]
+        if len(ages):
+            values = np.asarray(ages.index, dtype=float)
+            edges = np.arange(int(values.min()), int(values.max()) + 5, 5)
+            counts, edges = np.histogram(values, bins=edges, weights=ages.values)
+            ax.bar(edges[:-1], counts, width=np.diff(edges), align='edge', color='#4C72B0', edgecolor='black', alpha=0.85)
+        ax.set_title('Возраст', fontsize=14, fontweight='bold')
+        ax.set_ylabel('Количество', fontsize=11)
+
+        for ax, counts, name in ((axes[0, 2], banks, 'Топ банков'), (axes[1, 0], waiting, 'Время ожидания')):
+            positions = np.arange(len(counts))
+            ax.bar(positions, counts.values, width=0.8, color=palette('Set2', len(counts)), edgecolor='black')
+            ax.set_xticks(positions, [short_label(x, 14) for x in counts.index], rotation=30, ha='right', fontsize=10)
+            ax.set_title(name, fontsize=14, fontweight='bold')
+
+        ax = axes[1, 1]
+        if scorecard:
+            names, rates, lows, highs = (np.array(x) for x in zip(*scorecard))
+            rates, lows, highs = rates * 100, lows * 100, highs * 100
+            positions = np.arange(len(names))[::-1]
+            colors = ['#2ca02c' if r >= 80 else '#f0b400' if r >= 60 else '#d62728' for r in rates]
+            ax.barh(positions, rates, color=colors, edgecolor='black', alpha=0.85)
+            ax.errorbar(rates, positions, xerr=[rates - lows, highs - rates], fmt='none', ecolor='#333', capsize=3)
+            for y, r in zip(positions, rates):
+                ax.text(min(r + 2, 88), y, f'{r:.0f}%', va='center', fontsize=10, fontweight='bold')
+            ax.set_yticks(positions, [short_label(x, 16) for x in names], fontsize=10)
+            for threshold in (60, 80):
+                ax.axvline(threshold, color='#777', linestyle='--', linewidth=1)
+            ax.set_xlim(0, 100)
+        ax.set_title('Качество обслуживания, % положительных', fontsize=14, fontweight='bold')
+
+        ax = axes[1, 2]
+        ax.axis('off')
+        ax.text(0.02, 0.95, '\n'.join(summary), va='top', ha='left', fontsize=13, linespacing=1.7,
+                transform=ax.transAxes)
+        ax.set_title('Ключевые цифры', fontsize=14, fontweight='bold')
+        return self._encode(fig)
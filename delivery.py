@@ -0,0 +1,172 @@
+"""Отправка ответов в Telegram: очередь на чат, группировка графиков и лимиты.
+
+Вызывающий код ставит сообщения в очередь чата и продолжает работу (считать
+следующий график, ждать GPT), пока предыдущие уходят в Telegram. Внутри чата
+сообщения отправляются строго по порядку; несколько графиков подряд уходят
+одним sendMediaGroup. Частота ограничена на чат и на весь бот (token bucket),
+RetryAfter ждёт только очередь своего чата.
+
+Методы reply_* возвращают future с отправленным сообщением; если отправить не
+удалось, future завершается исключением - кому важен результат (отправка файла),
+тот его ждёт и проверяет. Очередь чата, простоявшая без дела столько, что её лимит
+полностью восстановился, удаляется.
+"""
+import asyncio
+import time
+from collections import deque
+
+from telegram import InputMediaPhoto
+from telegram.error import RetryAfter
+
+MEDIA_GROUP_LIMIT = 10
+
+
+def _rewind(photo):
+    if hasattr(photo, 'seek'):
+        photo.seek(0)
+    return photo
+
+
+def _retrieve(future):
+    if not future.cancelled():
+        future.exception()
+
+
+class TokenBucket:
+    """rate событий в секунду с запасом burst; acquire ждёт, если запас исчерпан"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        """Занимает токен и возвращает, сколько секунд ждать до него"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    @property
+    def full(self):
+        """Запас восстановился полностью - состояние лимита можно не хранить"""
+        return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.burst
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class _Outbox:
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.pending = deque()
+        self.task = None
+        self.last = None
+
+
+class Delivery:
+    """Очереди отправки по чатам поверх методов reply_* объекта Message"""
+
+    def __init__(self, chat_rate=1.0, chat_burst=5, global_rate=30.0, max_retries=3, sweep_every=60.0):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.max_retries = max_retries
+        self.sweep_every = sweep_every
+        self._outboxes = {}
+        self._swept = time.monotonic()
+
+    def reply_text(self, message, text, **kwargs):
+        return self._enqueue(message, lambda: message.reply_text(text, **kwargs))
+
+    def reply_photos(self, message, photos, **kwargs):
+        """Один график - sendPhoto, несколько - sendMediaGroup (по 10 в группе)"""
+        photos = [p for p in photos if p]
+        future = None
+        for i in range(0, len(photos), MEDIA_GROUP_LIMIT):
+            group = photos[i:i + MEDIA_GROUP_LIMIT]
+            # Файл читается при каждой попытке заново, поэтому буферы перематываются
+            if len(group) == 1:
+                future = self._enqueue(message, lambda p=group[0]: message.reply_photo(_rewind(p), **kwargs))
+            else:
+                future = self._enqueue(message, lambda g=group: message.reply_media_group(
+                    [InputMediaPhoto(_rewind(p)) for p in g], **kwargs))
+        return future
+
+    def reply_document(self, message, document, **kwargs):
+        return self._enqueue(message, lambda: message.reply_document(_rewind(document), **kwargs))
+
+    def edit_text(self, message, text, **kwargs):
+        """Правка уже отправленного сообщения (статус отчета) - в той же очереди чата"""
+        return self._enqueue(message, lambda: message.edit_text(text, **kwargs))
+
+    async def flush(self, message):
+        """Ждёт отправки всего, что уже поставлено в очередь этого чата (ошибки не пробрасывает)"""
+        outbox = self._outboxes.get(message.chat_id)
+        if outbox is not None and outbox.last is not None:
+            # wait, а не await: отмена flush не отменяет отправку, ошибка отправки не всплывает здесь
+            await asyncio.wait({outbox.last})
+
+    def _sweep(self):
+        now = time.monotonic()
+        if now - self._swept < self.sweep_every:
+            return
+        self._swept = now
+        idle = [chat_id for chat_id, outbox in self._outboxes.items()
+                if outbox.task is None and not outbox.pending and outbox.bucket.full]
+        for chat_id in idle:
+            del self._outboxes[chat_id]
+
+    def _enqueue(self, message, send):
+        chat_id = message.chat_id
+        self._sweep()
+        outbox = self._outboxes.get(chat_id)
+        if outbox is None:
+            outbox = self._outboxes[chat_id] = _Outbox(TokenBucket(self.chat_rate, self.chat_burst))
+        future = asyncio.get_running_loop().create_future()
+        # Ошибка уже в логе; если результат никто не ждёт, asyncio не должен ругаться на неё повторно
+        future.add_done_callback(_retrieve)
+        outbox.pending.append((send, future))
+        outbox.last = future
+        if outbox.task is None:
+            outbox.task = asyncio.create_task(self._drain(chat_id, outbox))
+        return future
+
+    async def _drain(self, chat_id, outbox):
+        try:
+            while outbox.pending:
+                send, future = outbox.pending.popleft()
+                if future.cancelled():
+                    # Вызывающий отменил ожидание до отправки - сообщение больше не нужно
+                    continue
+                try:
+                    result = await self._send(send, outbox)
+                except Exception as e:
+                    # Ошибка одного сообщения не останавливает очередь чата, но достаётся вызывающему
+                    print(f"Ошибка отправки в чат {chat_id}: {e!r}")
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            # Очередь чата остаётся (вместе с его лимитом частоты), пока лимит не восстановится; задача - нет
+            outbox.task = None
+
+    async def _send(self, send, outbox):
+        for attempt in range(self.max_retries + 1):
+            await outbox.bucket.acquire()
+            await self.global_bucket.acquire()
+            try:
+                return await send()
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                retry_after = e.retry_after
+                delay = retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else retry_after
+                print(f"Telegram просит подождать {delay} с")
+                await asyncio.sleep(delay)
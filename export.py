@@ -0,0 +1,272 @@
+"""Выгрузка таблиц опроса в файл (XLSX, CSV, Parquet) в отдельном процессе.
+
+Таблицы - частоты ответов по всем вопросам, доли положительных оценок с
+интервалами и разрезы ответов по сегментам (банк, пол) - считаются в процессе-
+воркере, а не в процессе бота: event loop не ждёт ни GIL, ни диска. Каждая
+таблица - генератор строк, писатель формата забирает их порциями и сразу пишет
+на диск (openpyxl в режиме write_only, csv построчно в zip, Parquet группами
+строк), поэтому в памяти нет ни всей выгрузки, ни её промежуточных DataFrame -
+только агрегаты текущего вопроса. В бот возвращается путь к готовому файлу.
+"""
+import asyncio
+import csv
+import io
+import itertools
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from importlib.util import find_spec
+
+import numpy as np
+import pandas as pd
+
+from stats import compute_quality_stats
+
+FORMATS = {
+    'xlsx': ('.xlsx', 'openpyxl'),
+    'csv': ('.zip', None),
+    'parquet': ('.zip', 'pyarrow'),
+}
+
+BATCH_ROWS = 50000
+XLSX_MAX_ROWS = 1048576
+
+
+class ExportError(Exception):
+    """Формат не поддерживается или для него не установлена библиотека"""
+
+
+class Table:
+    """Таблица выгрузки: колонки [(название, тип 'str' | 'int' | 'float')] и генератор строк"""
+
+    def __init__(self, name, columns, rows):
+        self.name = name
+        self.columns = columns
+        self.rows = rows
+        self.written = 0
+
+    @property
+    def header(self):
+        return [name for name, _ in self.columns]
+
+    def batches(self, size=BATCH_ROWS):
+        rows = iter(self.rows)
+        while True:
+            batch = list(itertools.islice(rows, size))
+            if not batch:
+                return
+            self.written += len(batch)
+            yield batch
+
+
+def _label(value):
+    # 34.0 -> '34': числовые ответы (возраст) хранятся как float
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _percent(part, total):
+    return round(part / total * 100, 2) if total else None
+
+
+def _answer_columns(df):
+    return [col for col in df.columns if not pd.api.types.is_datetime64_any_dtype(df[col])]
+
+
+def frequency_rows(df, columns):
+    for col in columns:
+        counts = df[col].value_counts()
+        counts = counts[counts > 0]
+        total = counts.sum()
+        for answer, count in counts.items():
+            yield col, _label(answer), int(count), _percent(count, total)
+
+
+def quality_rows(stats, labels, min_effect):
+    for m, metric in enumerate(stats.metrics):
+        for s, (dimension, segment) in enumerate(stats.segments):
+            total = int(stats.totals[m, s])
+            if not total:
+                continue
+            difference = ''
+            if s and stats.diff_low[m, s] > min_effect:
+                difference = 'выше'
+            elif s and stats.diff_high[m, s] < -min_effect:
+                difference = 'ниже'
+            yield (labels.get(metric, metric), dimension, _label(segment), int(stats.positives[m, s]), total,
+                   _percent(stats.rates[m, s], 1), _percent(stats.low[m, s], 1), _percent(stats.high[m, s], 1),
+                   difference)
+
+
+def segment_rows(df, columns, dimensions):
+    for dimension, dim_col in dimensions.items():
+        if dim_col not in df.columns:
+            continue
+        for col in columns:
+            if col == dim_col:
+                continue
+            counts = df.groupby([dim_col, col], observed=True, sort=False).size()
+            counts = counts[counts > 0]
+            if counts.empty:
+                continue
+            totals = counts.groupby(level=0, observed=True).sum().sort_values(ascending=False)
+            for segment, total in totals.items():
+                for answer, count in counts.xs(segment, level=0).sort_values(ascending=False).items():
+                    yield dimension, _label(segment), col, _label(answer), int(count), _percent(count, total)
+
+
+def build_tables(df, metrics, labels, dimensions, n_resamples, min_effect):
+    """Таблицы выгрузки; строки считаются лениво, по мере записи"""
+    columns = _answer_columns(df)
+    stats = compute_quality_stats(df, metrics, dimensions, n_resamples=n_resamples)
+    return [
+        Table('Частоты', [('Вопрос', 'str'), ('Ответ', 'str'), ('Количество', 'int'), ('Доля, %', 'float')],
+              frequency_rows(df, columns)),
+        Table('Качество', [('Метрика', 'str'), ('Измерение', 'str'), ('Сегмент', 'str'),
+                           ('Положительных', 'int'), ('Ответов', 'int'), ('Доля, %', 'float'),
+                           ('Нижняя граница, %', 'float'), ('Верхняя граница, %', 'float'),
+                           ('Отличие от остальных', 'str')],
+              quality_rows(stats, labels, min_effect)),
+        Table('Сегменты', [('Измерение', 'str'), ('Сегмент', 'str'), ('Вопрос', 'str'), ('Ответ', 'str'),
+                           ('Количество', 'int'), ('Доля в сегменте, %', 'float')],
+              segment_rows(df, columns, dimensions)),
+    ]
+
+
+def write_csv(tables, path):
+    # Несколько таблиц - несколько CSV в одном zip; BOM - чтобы Excel узнал UTF-8
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for table in tables:
+            with archive.open(f'{table.name}.csv', 'w') as raw:
+                text = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+                writer = csv.writer(text)
+                writer.writerow(table.header)
+                for batch in table.batches():
+                    writer.writerows(batch)
+                text.flush()
+                text.detach()
+
+
+def write_xlsx(tables, path):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+
+    def new_sheet(title):
+        sheet = workbook.create_sheet(title)
+        sheet.freeze_panes = 'A2'
+        sheet.append(table.header)
+        return sheet
+
+    for table in tables:
+        sheet, rows, part = new_sheet(table.name), 1, 1
+        for batch in table.batches():
+            for row in batch:
+                # Лист Excel вмещает 1 048 576 строк - остаток уходит на лист продолжения
+                if rows == XLSX_MAX_ROWS:
+                    part += 1
+                    sheet, rows = new_sheet(f'{table.name} ({part})'), 1
+                sheet.append(row)
+                rows += 1
+    workbook.save(path)
+
+
+def write_parquet(tables, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {'str': pa.string(), 'int': pa.int64(), 'float': pa.float64()}
+    directory = os.path.dirname(path) or '.'
+    # Parquet пишется группами строк в отдельные файлы, затем они складываются в zip без сжатия
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for table in tables:
+            schema = pa.schema([(name, types[kind]) for name, kind in table.columns])
+            fd, part_path = tempfile.mkstemp(suffix='.parquet', dir=directory)
+            os.close(fd)
+            try:
+                with pq.ParquetWriter(part_path, schema, compression='zstd') as writer:
+                    for batch in table.batches():
+                        columns = zip(*batch)
+                        writer.write_table(pa.Table.from_arrays(
+                            [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                            schema=schema,
+                        ))
+                    if not table.written:
+                        writer.write_table(schema.empty_table())
+                archive.write(part_path, f'{table.name}.parquet')
+            finally:
+                os.remove(part_path)
+
+
+WRITERS = {'xlsx': write_xlsx, 'csv': write_csv, 'parquet': write_parquet}
+
+
+def write_export(df, fmt, path, **tables):
+    """Точка входа процесса-воркера: пишет файл и возвращает {таблица: строк}"""
+    tables = build_tables(df, **tables)
+    try:
+        WRITERS[fmt](tables, path)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return {table.name: table.written for table in tables}
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class Exporter:
+    """Пул процессов для выгрузок и каталог, куда они пишутся"""
+
+    def __init__(self, directory='exports', workers=1):
+        self.directory = directory
+        self.workers = workers
+        self._pool = None
+
+    def check(self, fmt):
+        """ExportError, если формат не поддерживается или нет нужной библиотеки"""
+        if fmt not in FORMATS:
+            raise ExportError(f"формат {fmt} не поддерживается, доступны: {', '.join(FORMATS)}")
+        module = FORMATS[fmt][1]
+        if module and find_spec(module) is None:
+            raise ExportError(f"для {fmt} не установлен пакет {module}")
+
+    def suffix(self, fmt):
+        return FORMATS[fmt][0]
+
+    def _executor(self):
+        # Процессы создаются при первой выгрузке; spawn, а не fork: в процессе бота работают потоки
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    async def export(self, df, fmt, **tables):
+        """(путь к файлу, {таблица: строк}); файл удаляет вызывающий код"""
+        self.check(fmt)
+        os.makedirs(self.directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix='export-', suffix=self.suffix(fmt), dir=self.directory)
+        os.close(fd)
+        future = self._executor().submit(write_export, df, fmt, path, **tables)
+        try:
+            counts = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # Запущенную запись процесс доведёт до конца - файл удалится, когда она закончится
+            future.cancel()
+            future.add_done_callback(lambda f: _remove(path))
+            raise
+        except BaseException:
+            _remove(path)
+            raise
+        return path, counts
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,196 @@
+"""Локальные заглушки Telegram, Google Sheets и OpenAI с внедрением задержек и ошибок.
+
+Позволяют проверить поведение бота при медленных и падающих зависимостях без сети:
+
+    import test
+    from fakes import FaultInjector, FakeWorksheet, FakeOpenAI, sample_records
+    test.open_worksheet = lambda *args: FakeWorksheet(sample_records(500), FaultInjector(latency=3.0))
+    test.client = FakeOpenAI(FaultInjector(error_rate=0.5))
+"""
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from telegram.request import BaseRequest
+
+
+class InjectedFault(Exception):
+    """Искусственная ошибка зависимости"""
+
+
+class FaultInjector:
+    """Задержка (с разбросом) и ошибки с заданной вероятностью на каждый вызов"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = 0
+        self._fail_next = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def fail_next(self, n=1):
+        with self._lock:
+            self._fail_next += n
+
+    def _draw(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            fail = self._fail_next > 0 or self._rng.random() < self.error_rate
+            if self._fail_next > 0:
+                self._fail_next -= 1
+        return delay, fail
+
+    def __call__(self):
+        delay, fail = self._draw()
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise InjectedFault("injected fault")
+
+    async def wait(self):
+        """То же для асинхронного кода: задержка без блокировки event loop"""
+        delay, fail = self._draw()
+        if delay:
+            await asyncio.sleep(delay)
+        if fail:
+            raise InjectedFault("injected fault")
+
+
+class FakeWorksheet:
+    """Подмена gspread.Worksheet"""
+
+    def __init__(self, records, faults=None):
+        self.records = records
+        self.faults = faults or FaultInjector()
+
+    def get_all_records(self):
+        self.faults()
+        return [dict(r) for r in self.records]
+
+    def get_values(self, range_name):
+        """Диапазон строк вида '2:5001' (нумерация с 1, первая строка - заголовки)"""
+        self.faults()
+        first, last = (int(x) for x in range_name.split(':'))
+        header = list(self.records[0]) if self.records else []
+        rows = [[str(r.get(h, '')) for h in header] for r in self.records[max(first - 2, 0):last - 1]]
+        return ([header] if first == 1 and header else []) + rows
+
+
+class FakeOpenAI:
+    """Подмена openai.OpenAI: поддерживает только chat.completions.create"""
+
+    def __init__(self, faults=None, reply="🤖 Тестовый ответ аналитика"):
+        self.faults = faults or FaultInjector()
+        self.reply = reply
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, **kwargs):
+        self.faults()
+        message = SimpleNamespace(role='assistant', content=self.reply)
+        return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message)])
+
+
+class FakeTelegramRequest(BaseRequest):
+    """Подмена HTTP-слоя python-telegram-bot: отвечает как Bot API, не выходя в сеть
+
+    Передаётся в Application.builder().request(...); calls считает вызовы по методам API.
+    """
+
+    def __init__(self, faults=None):
+        self.faults = faults or FaultInjector()
+        self.calls = Counter()
+        self._ids = itertools.count(1)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _message(self, params, **content):
+        chat_id = params.get('chat_id', 1)
+        return {
+            'message_id': next(self._ids), 'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'}, **content,
+        }
+
+    def _photo(self):
+        file_id = f'photo{next(self._ids)}'
+        return [{'file_id': file_id, 'file_unique_id': file_id, 'width': 1080, 'height': 600}]
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        name = url.rsplit('/', 1)[-1]
+        self.calls[name] += 1
+        await self.faults.wait()
+        params = request_data.parameters if request_data is not None else {}
+        if name == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'LoadTest', 'username': 'load_test_bot'}
+        elif name in ('sendMessage', 'editMessageText'):
+            result = self._message(params, text=params.get('text', ''))
+        elif name == 'sendPhoto':
+            result = self._message(params, photo=self._photo())
+        elif name == 'sendMediaGroup':
+            result = [self._message(params, photo=self._photo()) for _ in params.get('media', [])]
+        elif name == 'sendDocument':
+            file_id = f'doc{next(self._ids)}'
+            result = self._message(params, document={'file_id': file_id, 'file_unique_id': file_id})
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+SURVEY_ANSWERS = {
+    "Укажите ваш пол.": ["Мужской", "Женский"],
+    "Укажите ваш возраст.": [str(a) for a in range(18, 71)],
+    "Назовите банк, отделение которого вы посещали недавно.": [
+        "Сбербанк", "Сбер", "сбербанк", "ВТБ", "Альфа-Банк", "Тинькофф", "Газпромбанк",
+    ],
+    "С какой целью вы посетили отделение банка?": [
+        "Открытие счета", "Получение кредита", "Оплата услуг", "Консультация",
+    ],
+    "Сколько времени вы обычно ждете в очереди до получения обслуживания?": [
+        "Менее 5 минут", "5-10 минут", "10-20 минут", "Более 20 минут",
+    ],
+    "Как вы оцениваете удобство расположения отделения банка?": ["Отлично", "Хорошо", "Удовлетворительно", "Плохо"],
+    "Насколько вежливы и доброжелательны сотрудники банка?": ["Очень вежливы", "Вежливы", "Нейтрально", "Невежливы"],
+    "Как вы оцениваете компетентность сотрудников в решении вопросов?": ["Очень высокая", "Высокая", "Средняя", "Низкая"],
+    "Как вы оцениваете доступность информации о банковских услугах в отделении?": [
+        "Очень доступна", "Доступна", "Малодоступна", "Недоступна",
+    ],
+    "Удобно ли вам пользоваться электронными терминалами или приложением?": [
+        "Очень удобно", "Удобно", "Неудобно", "Не пользуюсь",
+    ],
+    "Порекомендовали бы вы это отделение банка своим друзьям и знакомым?": [
+        "Определенно да", "Скорее да", "Скорее нет", "Определенно нет",
+    ],
+    "Насколько понятно сотрудники объясняют условия банковских продуктов (кредиты, вклады и т.п.)?": [
+        "Очень понятно", "Понятно", "Не совсем понятно", "Непонятно",
+    ],
+    "Как вы оцениваете чистоту и комфорт в помещении отделения?": ["Отлично", "Хорошо", "Удовлетворительно", "Плохо"],
+    "Были ли у вас случаи, когда ваш вопрос не решился?": [
+        "Нет, все вопросы решены", "Да, один раз", "Да, несколько раз",
+    ],
+}
+
+
+def sample_records(n, seed=0, start=datetime(2024, 1, 1)):
+    """Синтетические ответы в формате get_all_records() Google Forms"""
+    rng = random.Random(seed)
+    records = []
+    for i in range(n):
+        ts = start + timedelta(minutes=i * 17 + rng.randint(0, 16))
+        row = {"Отметка времени": ts.strftime('%d.%m.%Y %H:%M:%S')}
+        for col, answers in SURVEY_ANSWERS.items():
+            row[col] = rng.choice(answers)
+        records.append(row)
+    return records
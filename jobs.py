@@ -0,0 +1,187 @@
+"""Очередь тяжёлых отчётов: обработчик ставит задачу и сразу освобождается.
+
+Задачи выполняют N фоновых воркеров (asyncio); вычисления внутри задачи уходят
+в пул потоков того же размера, поэтому одновременно строится не больше N отчётов.
+Задача сообщает о ходе работы через progress(), её можно отменить в очереди
+и во время выполнения; на каждый чат действует лимит активных задач.
+Отмена прерывает корутину задачи на ближайшем await, следующие шаги не
+выполняются; но вычисление, уже отданное в run_sync, поток досчитает до конца -
+прервать поток Python нельзя, поэтому шаги задачи стоит делать короткими.
+"""
+import asyncio
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+
+
+class JobLimitError(Exception):
+    """Очередь заполнена или у чата слишком много активных задач"""
+
+
+class JobFailed(Exception):
+    """Задача не может построить отчет (нет данных и т.п.); причину пользователю она уже сообщила"""
+
+
+class Job:
+    """Отчёт в очереди: run(job) - корутина, notify(job, text) - показ статуса пользователю"""
+
+    def __init__(self, job_id, chat_id, title, run, notify=None, executor=None, min_interval=1.0):
+        self.id = job_id
+        self.chat_id = chat_id
+        self.title = title
+        self.run = run
+        self.notify = notify
+        self.state = QUEUED
+        self.error = None
+        self.created = time.monotonic()
+        self.started = None
+        self.finished = None
+        self.task = None
+        self._executor = executor
+        self._min_interval = min_interval
+        self._last_text = None
+        self._last_notify = 0.0
+
+    @property
+    def active(self):
+        return self.state in (QUEUED, RUNNING)
+
+    async def progress(self, text, force=False):
+        """Обновляет статус; промежуточные обновления не чаще min_interval (лимиты Telegram)"""
+        now = time.monotonic()
+        if self.notify is None or text == self._last_text:
+            return
+        if not force and now - self._last_notify < self._min_interval:
+            return
+        self._last_text, self._last_notify = text, now
+        try:
+            await self.notify(self, text)
+        except Exception as e:
+            print(f"Не удалось обновить статус задачи {self.id}: {e!r}")
+
+    async def run_sync(self, fn, *args):
+        """Синхронное вычисление в пуле потоков очереди, не блокируя event loop
+
+        При отмене задачи ожидание прерывается сразу, а сам поток досчитывает шаг.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def status_text(self):
+        if self.state == DONE:
+            return f"✅ {self.title}: готово за {self.finished - self.started:.1f} с"
+        if self.state == CANCELLED:
+            return f"⏹ {self.title}: отменено"
+        if self.state == FAILED:
+            return f"❌ {self.title}: не удалось построить отчет"
+        return f"⏳ {self.title}"
+
+
+class ReportQueue:
+    """Ограниченная очередь отчётов с пулом из workers воркеров"""
+
+    def __init__(self, workers=2, max_queued=50, per_chat=2, timeout=300):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.per_chat = per_chat
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._jobs = {}
+        self._queue = None
+        self._tasks = []
+        self._executor = None
+        self._notifications = set()
+
+    def _start(self):
+        # Воркеры создаются при первой задаче - внутри работающего event loop
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='report')
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for job in list(self._jobs.values()):
+            self.cancel(job.chat_id, job.id)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def active(self, chat_id=None):
+        return [job for job in self._jobs.values() if chat_id is None or job.chat_id == chat_id]
+
+    @property
+    def idle_workers(self):
+        return max(0, self.workers - sum(job.state == RUNNING for job in self._jobs.values()))
+
+    def position(self, job):
+        """Сколько задач ждёт перед этой, когда свободные воркеры разберут свои (0 - начнётся сразу)"""
+        if job.state != QUEUED:
+            return 0
+        queued = [j for j in self._jobs.values() if j.state == QUEUED]
+        return max(0, queued.index(job) + 1 - self.idle_workers)
+
+    def submit(self, chat_id, title, run, notify=None):
+        if len(self.active(chat_id)) >= self.per_chat:
+            raise JobLimitError(f"в работе уже {self.per_chat} отчета для этого чата")
+        if sum(job.state == QUEUED for job in self._jobs.values()) >= self.max_queued:
+            raise JobLimitError("очередь отчетов заполнена")
+        self._start()
+        job = Job(next(self._ids), chat_id, title, run, notify, self._executor)
+        self._jobs[job.id] = job
+        self._queue.put_nowait(job)
+        return job
+
+    def cancel(self, chat_id, job_id=None):
+        """Отменяет задачи чата (все или одну); возвращает отменённые"""
+        cancelled = []
+        for job in self.active(chat_id):
+            if job_id is not None and job.id != job_id:
+                continue
+            if job.state == QUEUED:
+                # Воркер пропустит её, когда дойдёт очередь
+                self._finish(job, CANCELLED)
+            elif job.task is not None:
+                job.task.cancel()
+            cancelled.append(job)
+        return cancelled
+
+    def _finish(self, job, state, error=None):
+        job.state, job.error = state, error
+        job.finished = time.monotonic()
+        job.started = job.started or job.finished
+        self._jobs.pop(job.id, None)
+        if job.notify is not None:
+            task = asyncio.get_running_loop().create_task(job.progress(job.status_text(), force=True))
+            self._notifications.add(task)
+            task.add_done_callback(self._notifications.discard)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            if job.state != QUEUED:
+                continue
+            job.state, job.started = RUNNING, time.monotonic()
+            job.task = asyncio.create_task(job.run(job))
+            # asyncio.wait не пробрасывает отмену задачи в сам воркер
+            done, _ = await asyncio.wait({job.task}, timeout=self.timeout)
+            if not done:
+                job.task.cancel()
+                await asyncio.wait({job.task})
+                print(f"Отчет {job.id} ({job.title}) превысил {self.timeout} с")
+                self._finish(job, FAILED, TimeoutError(self.timeout))
+            elif job.task.cancelled():
+                self._finish(job, CANCELLED)
+            elif job.task.exception() is not None:
+                print(f"Ошибка в отчете {job.id} ({job.title}): {job.task.exception()!r}")
+                self._finish(job, FAILED, job.task.exception())
+            else:
+                self._finish(job, DONE)
@@ -0,0 +1,172 @@
+"""Нагрузочный тест бота: синтетические пользователи Telegram против Application из test.py.
+
+Telegram, Google Sheets и OpenAI подменяются локальными заглушками с настраиваемой задержкой
+(fakes.py). Каждый виртуальный пользователь - отдельный чат, который отправляет сообщение,
+ждёт окончания обработки и отправляет следующее. Для каждого уровня одновременности
+печатаются пропускная способность и p50/p95/p99 задержки по каждому типу запроса;
+для фоновых отчетов задержка - до готовности отчета, а не до постановки в очередь.
+
+    python loadtest.py --levels 1,5,10,25,50 --duration 15 --openai-latency 2
+    python loadtest.py --levels 1,5,10,25,50 --concurrent-updates 8   # параллельная обработка апдейтов
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+
+# (тип запроса, текст сообщения, вес в смеси)
+INTENTS = [
+    ('полный отчет', '📊 Полный отчет', 1),
+    ('быстрый анализ', '🎯 Быстрый анализ', 3),
+    ('гендер', '👥 Гендерный состав', 2),
+    ('возраст', '📈 Возрастная статистика', 2),
+    ('банки', '🏦 Топ банков', 2),
+    ('цели', '💼 Цели посещения', 1),
+    ('качество', '⭐ Оценки качества', 2),
+    ('ожидание', '⏰ Время ожидания', 1),
+    ('динамика', 'Динамика рекомендаций за месяц', 1),
+    ('вопрос', 'Какие банки самые популярные?', 3),
+]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--levels', default='1,5,10,25', help='числа одновременных чатов через запятую')
+    parser.add_argument('--duration', type=float, default=10.0, help='секунд на каждый уровень')
+    parser.add_argument('--think', type=float, default=0.0, help='средняя пауза пользователя между сообщениями, с')
+    parser.add_argument('--rows', type=int, default=2000, help='строк в синтетическом опросе')
+    parser.add_argument('--telegram-latency', type=float, default=0.05)
+    parser.add_argument('--sheets-latency', type=float, default=0.5)
+    parser.add_argument('--openai-latency', type=float, default=2.0)
+    parser.add_argument('--jitter', type=float, default=0.5, help='доля случайного разброса задержек')
+    parser.add_argument('--concurrent-updates', type=int, default=None,
+                        help='CONCURRENT_UPDATES бота (по умолчанию - как у бота: из окружения или 1)')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def configure_environment(args):
+    """Переменные окружения нужно выставить до импорта test.py"""
+    os.environ['TELEGRAM_TOKEN'] = '123456:LOADTEST'
+    os.environ['SHEET_ID'] = 'loadtest'
+    os.environ['OPENAI_API_KEY'] = 'sk-loadtest'
+    os.environ['BANK_ALIASES_PATH'] = os.path.join(tempfile.gettempdir(), 'loadtest_bank_aliases.json')
+    # Виртуальные пользователи пишут без пауз - лимит частоты на чат Telegram здесь не моделируем
+    os.environ['TELEGRAM_CHAT_RATE'] = '1000'
+    os.environ['TELEGRAM_CHAT_BURST'] = '1000'
+    # Без флага меряем ту настройку, с которой бот и работает
+    if args.concurrent_updates is not None:
+        os.environ['CONCURRENT_UPDATES'] = str(args.concurrent_updates)
+
+
+def percentile_row(name, samples, elapsed):
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+    return f"  {name:<16} {len(samples):>6} {len(samples) / elapsed:>9.2f} {p50:>9.0f} {p95:>9.0f} {p99:>9.0f}"
+
+
+async def run(args):
+    import warnings
+    warnings.filterwarnings('ignore')  # нет глифов эмодзи в шрифте графиков
+    import test
+    from fakes import FakeOpenAI, FakeTelegramRequest, FakeWorksheet, FaultInjector, sample_records
+    from telegram import Update
+    from telegram.ext import TypeHandler
+
+    def faults(latency):
+        return FaultInjector(latency=latency * (1 - args.jitter / 2), jitter=latency * args.jitter, seed=args.seed)
+
+    worksheet = FakeWorksheet(sample_records(args.rows, seed=args.seed), faults(args.sheets_latency))
+    test.open_worksheet = lambda *_: worksheet
+    test.client = FakeOpenAI(faults(args.openai_latency))
+    telegram = FakeTelegramRequest(faults(args.telegram_latency))
+
+    app = test.build_application(test.TELEGRAM_TOKEN, request=telegram, get_updates_request=FakeTelegramRequest())
+    pending = {}
+    errors = defaultdict(int)
+
+    async def on_processed(update, context):
+        future = pending.pop(update.update_id, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    async def on_error(update, context):
+        errors[type(context.error).__name__] += 1
+
+    # Группа 1 выполняется после всех обработчиков группы 0 - это и есть конец обработки апдейта
+    app.add_handler(TypeHandler(Update, on_processed), group=1)
+    app.add_error_handler(on_error)
+
+    rng = random.Random(args.seed)
+    names, texts, weights = zip(*INTENTS)
+    update_ids = iter(range(1, 10**9))
+
+    async def send(chat_id, text):
+        update_id = next(update_ids)
+        update = Update.de_json({
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id, 'date': int(time.time()), 'text': text,
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': {'id': chat_id, 'is_bot': False, 'first_name': f'User{chat_id}'},
+            },
+        }, app.bot)
+        future = asyncio.get_running_loop().create_future()
+        pending[update_id] = future
+        start = time.perf_counter()
+        await app.update_queue.put(update)
+        await future
+        # Фоновый отчет: обработчик только ставит его в очередь - ждём готовности самого отчета
+        if text.lower() in test.REPORT_JOBS:
+            while test.report_queue.active(chat_id):
+                await asyncio.sleep(0.01)
+        return time.perf_counter() - start
+
+    async with app:
+        await app.start()
+        print(f"CONCURRENT_UPDATES={test.CONCURRENT_UPDATES}, строк в опросе: {args.rows}, задержки "
+              f"Telegram/Sheets/OpenAI: {args.telegram_latency}/{args.sheets_latency}/{args.openai_latency} с")
+        cold = await send(1, '🎯 Быстрый анализ')
+        print(f"Первый запрос (загрузка таблицы): {cold * 1000:.0f} мс\n")
+        for level in [int(x) for x in args.levels.split(',')]:
+            samples = defaultdict(list)
+            stop_at = time.monotonic() + args.duration
+
+            async def user(chat_id):
+                while time.monotonic() < stop_at:
+                    i = rng.choices(range(len(INTENTS)), weights)[0]
+                    samples[names[i]].append(await send(chat_id, texts[i]))
+                    if args.think:
+                        await asyncio.sleep(rng.expovariate(1 / args.think))
+
+            started = time.monotonic()
+            await asyncio.gather(*(user(1000 + n) for n in range(level)))
+            elapsed = time.monotonic() - started
+            total = [x for values in samples.values() for x in values]
+            print(f"Одновременных чатов: {level}")
+            print(f"  {'запрос':<16} {'кол-во':>6} {'запр/с':>9} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9}")
+            for name in names:
+                if samples[name]:
+                    print(percentile_row(name, samples[name], elapsed))
+            print(percentile_row('ВСЕГО', total, elapsed))
+            print()
+        await app.stop()
+    if errors:
+        print("Ошибки в обработчиках:", dict(errors))
+    print("Вызовы Bot API:", dict(telegram.calls))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_environment(args)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
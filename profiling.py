@@ -0,0 +1,143 @@
+"""Профилирование работающего бота по команде администратора, без перезапуска.
+
+На время захвата обработчик сообщений подменяется обёрткой, включаются cProfile
+(в потоке event loop) и tracemalloc (все потоки). Захват заканчивается после N
+вызовов или через T секунд: снимок памяти, профиль и топ выделений пишутся
+в файлы в пуле потоков (не в event loop), краткая сводка передаётся в on_finish. Вне захвата обработчик - исходная функция,
+никаких проверок на пути запроса нет.
+"""
+import asyncio
+import cProfile
+import os
+import time
+import tracemalloc
+
+
+class Profiler:
+    """Захват профиля для callback одного обработчика python-telegram-bot"""
+
+    def __init__(self, directory='profiles', top=15, max_seconds=300):
+        self.directory = directory
+        self.top = top
+        self.max_seconds = max_seconds
+        self.handler = None
+        self.active = False
+        self._original = None
+        self._profile = None
+        self._own_tracemalloc = False
+        self._timer = None
+        self._collecting = None
+        self._tasks = set()
+
+    def attach(self, handler):
+        """Обработчик, вызовы которого будут профилироваться"""
+        self.handler = handler
+        self._original = handler.callback
+
+    def start(self, on_finish, calls=None, seconds=None, top=None):
+        """Начинает захват на calls вызовов и/или seconds секунд (не дольше max_seconds)"""
+        if self.active:
+            raise RuntimeError("профилирование уже идёт")
+        if self._collecting is not None:
+            raise RuntimeError("предыдущий профиль ещё сохраняется")
+        if self.handler is None:
+            raise RuntimeError("нет обработчика для профилирования")
+        if (calls is not None and calls <= 0) or (seconds is not None and seconds <= 0):
+            raise RuntimeError("число сообщений и секунд должно быть больше нуля")
+        seconds = min(seconds or self.max_seconds, self.max_seconds)
+        self.active = True
+        self._on_finish = on_finish
+        self._limit = calls
+        self._top = top or self.top
+        self._durations = []
+        self._started = time.monotonic()
+        self._profile = cProfile.Profile()
+        try:
+            self._profile.enable()
+        except ValueError:
+            # В процессе уже работает другой профилировщик (sys.setprofile занят)
+            self.active = False
+            self._profile = None
+            raise RuntimeError("в процессе уже работает другой профилировщик")
+        self._own_tracemalloc = not tracemalloc.is_tracing()
+        if self._own_tracemalloc:
+            tracemalloc.start()
+        self.handler.callback = self._profiled
+        self._timer = asyncio.get_running_loop().call_later(seconds, self.stop)
+
+    async def _profiled(self, update, context):
+        started = time.perf_counter()
+        try:
+            return await self._original(update, context)
+        finally:
+            if self.active:
+                self._durations.append(time.perf_counter() - started)
+                if self._limit and len(self._durations) >= self._limit:
+                    self.stop()
+
+    def stop(self):
+        """Завершает захват; файлы пишутся в пуле потоков, сводка потом уходит в on_finish"""
+        if not self.active:
+            return
+        self.active = False
+        self.handler.callback = self._original
+        self._timer.cancel()
+        self._profile.disable()
+        elapsed = time.monotonic() - self._started
+        profile, self._profile = self._profile, None
+        task = asyncio.get_running_loop().create_task(self._finish(profile, elapsed))
+        self._collecting = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _finish(self, profile, elapsed):
+        try:
+            summary = await asyncio.get_running_loop().run_in_executor(None, self._collect, profile, elapsed)
+        finally:
+            self._collecting = None
+        await self._on_finish(summary)
+
+    def _collect(self, profile, elapsed):
+        # Снимок памяти и запись файлов - сотни миллисекунд на большом процессе, поэтому не в event loop
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, cProfile.__file__),
+        ))
+        if self._own_tracemalloc:
+            tracemalloc.stop()
+
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        os.makedirs(self.directory, exist_ok=True)
+        profile_path = os.path.join(self.directory, f'profile-{stamp}.prof')
+        alloc_path = os.path.join(self.directory, f'alloc-{stamp}.txt')
+        profile.dump_stats(profile_path)
+        allocations = snapshot.statistics('lineno')
+        with open(alloc_path, 'w', encoding='utf-8') as f:
+            for stat in allocations[:200]:
+                f.write(f"{stat}\n")
+
+        return self.summary(profile, allocations, elapsed, profile_path, alloc_path)
+
+    def summary(self, profile, allocations, elapsed, profile_path, alloc_path):
+        profile.create_stats()
+        # (файл, строка, функция) -> (примитивные вызовы, вызовы, собственное время, суммарное время, ...)
+        hot = sorted(profile.stats.items(), key=lambda item: item[1][2], reverse=True)[:self._top]
+        total_alloc = sum(stat.size for stat in allocations)
+
+        text = f"🔬 Профиль: {len(self._durations)} вызовов за {elapsed:.1f} с\n"
+        if self._durations:
+            durations = sorted(self._durations)
+            text += (f"Обработка: среднее {sum(durations) / len(durations) * 1000:.0f} мс, "
+                     f"максимум {durations[-1] * 1000:.0f} мс\n")
+        text += "\n🔥 Горячие функции (собственное / суммарное время, вызовов):\n"
+        for (filename, line, func), (_, calls, own, cumulative, _) in hot:
+            # У встроенных функций нет файла ('~')
+            where = f" ({os.path.basename(filename)}:{line})" if line else ""
+            text += f"{own * 1000:.0f} / {cumulative * 1000:.0f} мс, {calls} - {func}{where}\n"
+        text += f"\n🧠 Выделения памяти (живые на конец захвата, всего {total_alloc / 2**20:.1f} МБ):\n"
+        for stat in allocations[:self._top]:
+            frame = stat.traceback[0]
+            text += f"{stat.size / 1024:.0f} КБ, {stat.count} блоков - {os.path.basename(frame.filename)}:{frame.lineno}\n"
+        text += f"\nФайлы: {profile_path}, {alloc_path}\n"
+        text += "cProfile видит только поток event loop; работа в пулах потоков попадает в сводку памяти"
+        return text
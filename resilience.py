@@ -0,0 +1,162 @@
+"""Отказоустойчивость внешних вызовов: дедлайны, таймауты, ретраи и circuit breaker."""
+import asyncio
+import functools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DeadlineExceeded(Exception):
+    """Бюджет времени на запрос исчерпан"""
+
+
+class CircuitOpenError(Exception):
+    """Зависимость отключена автоматом (circuit breaker разомкнут)"""
+
+
+class Deadline:
+    """Бюджет времени на обработку одного запроса пользователя"""
+
+    def __init__(self, budget, clock=time.monotonic):
+        self._clock = clock
+        self.expires_at = clock() + budget
+
+    def remaining(self):
+        return max(0.0, self.expires_at - self._clock())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+
+class CircuitBreaker:
+    """Размыкается после серии ошибок и пропускает пробный вызов через reset_timeout секунд"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._trial_in_flight:
+            # Пропускаем ровно один пробный вызов
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def release(self):
+        """Вызов прерван не по вине зависимости (отмена) - пробный слот освобождается без ошибки"""
+        self._trial_in_flight = False
+
+    def record_success(self):
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._trial_in_flight or self._failures >= self.failure_threshold:
+            if self._opened_at is None:
+                print(f"Circuit breaker '{self.name}' разомкнут после {self._failures} ошибок")
+            self._opened_at = self._clock()
+        self._trial_in_flight = False
+
+
+class Dependency:
+    """Внешняя зависимость: свой пул потоков, таймаут на попытку, ретраи с джиттером и breaker.
+
+    Синхронная функция выполняется в отдельном пуле потоков, поэтому зависшая
+    библиотека не блокирует event loop и не занимает потоки других зависимостей.
+    Поток, брошенный по таймауту, прервать нельзя - он досчитывает в фоне. Пока
+    все max_workers потоков заняты такими вызовами, новые попытки сразу считаются
+    неудачными, а не ждут в очереди пула.
+    """
+
+    def __init__(self, name, timeout, retries=2, backoff=0.2, max_backoff=2.0,
+                 breaker=None, max_workers=4, rng=None):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker(name)
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._abandoned = 0
+        self._lock = threading.Lock()
+        self._rng = rng or random.Random()
+
+    def _delay(self, attempt):
+        # "Full jitter": равномерно от 0 до экспоненциального потолка
+        return self._rng.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def _release_abandoned(self, future):
+        # Вызывается из потока пула, когда брошенный вызов всё-таки закончился
+        with self._lock:
+            self._abandoned -= 1
+
+    async def _attempt(self, fn, timeout):
+        if self._abandoned >= self.max_workers:
+            raise TimeoutError(f"{self.name}: все {self.max_workers} потока заняты зависшими вызовами")
+        future = self._executor.submit(fn)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except BaseException:
+            # Не начавшийся вызов отменяется, начавшийся - досчитает и освободит поток сам
+            if not future.cancel() and not future.done():
+                with self._lock:
+                    self._abandoned += 1
+                future.add_done_callback(self._release_abandoned)
+            raise
+
+    async def call(self, fn, *args, deadline=None, **kwargs):
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"{self.name}: circuit breaker разомкнут") from last_error
+            timeout = self.timeout
+            if deadline is not None:
+                if deadline.expired:
+                    raise DeadlineExceeded(f"{self.name}: бюджет времени исчерпан") from last_error
+                timeout = min(timeout, deadline.remaining())
+            try:
+                result = await self._attempt(functools.partial(fn, *args, **kwargs), timeout)
+            except asyncio.CancelledError:
+                # Отмена (/cancel, таймаут отчета) - не ошибка зависимости, но пробный вызов breaker'а
+                # должен освободиться, иначе он навсегда останется полуоткрытым
+                self.breaker.release()
+                raise
+            except Exception as e:
+                self.breaker.record_failure()
+                last_error = e
+                print(f"{self.name}: попытка {attempt + 1} не удалась: {e!r}")
+            else:
+                self.breaker.record_success()
+                return result
+            if attempt == self.retries:
+                break
+            delay = self._delay(attempt)
+            if deadline is not None and delay >= deadline.remaining():
+                break
+            await asyncio.sleep(delay)
+        raise last_error
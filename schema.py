@@ -0,0 +1,183 @@
+"""Схема опроса: тип каждой колонки определяется и разбирается один раз при загрузке снимка.
+
+Типы: numeric (число), ordinal (упорядоченная шкала), nominal (варианты ответа),
+timestamp (время), text (свободный текст). Разбор идёт по уникальным значениям
+(pd.factorize), после чего результат раскладывается по строкам через коды.
+Категориальные колонки (постраничная загрузка) разбираются по словарю категорий.
+Нераспознанные значения не роняют загрузку: они становятся пропусками и попадают в отчёт.
+"""
+import warnings
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+NUMERIC = 'numeric'
+ORDINAL = 'ordinal'
+NOMINAL = 'nominal'
+TIMESTAMP = 'timestamp'
+TEXT = 'text'
+
+TIMESTAMP_FORMAT = '%d.%m.%Y %H:%M:%S'
+
+ColumnSchema = namedtuple('ColumnSchema', ['name', 'kind', 'invalid', 'examples'])
+
+
+class SchemaReport:
+    """Типы колонок и ошибки разбора по всем колонкам сразу"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.columns = {}
+
+    def add(self, name, kind, invalid=0, examples=()):
+        self.columns[name] = ColumnSchema(name, kind, invalid, list(examples))
+
+    @property
+    def errors(self):
+        return [c for c in self.columns.values() if c.invalid]
+
+    def summary(self):
+        kinds = {}
+        for c in self.columns.values():
+            kinds[c.kind] = kinds.get(c.kind, 0) + 1
+        text = f"Схема опроса: {self.rows} строк, " + ', '.join(f"{k}: {v}" for k, v in kinds.items())
+        for c in self.errors:
+            examples = ', '.join(repr(e) for e in c.examples)
+            text += f"\n  ⚠️ {c.name[:60]} ({c.kind}): не распознано {c.invalid} значений, например {examples}"
+        return text
+
+
+def column_kind(series):
+    """Тип уже типизированной колонки (по dtype, без разбора строк)"""
+    dtype = series.dtype
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return TIMESTAMP
+    if isinstance(dtype, pd.CategoricalDtype):
+        return ORDINAL if dtype.ordered else NOMINAL
+    if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+        return NUMERIC
+    return TEXT
+
+
+def _parse_numbers(uniques, extract):
+    if extract:
+        return pd.to_numeric(uniques.str.extract(r'(\d+)', expand=False), errors='coerce').to_numpy(dtype=float)
+    return pd.to_numeric(uniques.str.replace(',', '.', regex=False), errors='coerce').to_numpy(dtype=float)
+
+
+def parse_timestamps(values):
+    """Строки с отметкой времени -> datetime64 (пустые и нераспознанные - NaT)"""
+    return _parse_timestamps(pd.Index(values, dtype=object)).to_numpy()
+
+
+def _parse_timestamps(uniques):
+    parsed = pd.to_datetime(uniques, format=TIMESTAMP_FORMAT, errors='coerce')
+    if parsed.isna().all():
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)  # формат угадывается по значениям
+            parsed = pd.to_datetime(uniques, dayfirst=True, errors='coerce')
+    return parsed
+
+
+def _infer(uniques, counts, rows, scales):
+    """Тип колонки по уникальным непустым значениям и их частотам"""
+    total = counts.sum()
+    if total == 0:
+        return TEXT, None
+    parsed = _parse_numbers(uniques, extract=False)
+    if counts[~np.isnan(parsed)].sum() >= 0.9 * total:
+        return NUMERIC, None
+    for scale in scales:
+        if counts[uniques.isin(scale)].sum() >= 0.8 * total:
+            return ORDINAL, scale
+    sample = uniques[:20]
+    if pd.to_datetime(sample, format=TIMESTAMP_FORMAT, errors='coerce').notna().mean() >= 0.9:
+        return TIMESTAMP, None
+    if len(uniques) <= max(50, rows // 2):
+        return NOMINAL, None
+    return TEXT, None
+
+
+def _examples(uniques, bad, limit=3):
+    return list(uniques[bad][:limit])
+
+
+def apply_schema(df, hints=None, scales=()):
+    """Возвращает (типизированный DataFrame, SchemaReport)
+
+    hints - {колонка: тип} для колонок, тип которых известен заранее
+    (для numeric по подсказке берётся первое число в ответе: '25 лет' -> 25);
+    scales - упорядоченные шкалы ответов (от худшего к лучшему) для ordinal.
+    """
+    hints = hints or {}
+    rows = len(df)
+    report = SchemaReport(rows)
+    typed = {}
+    for col in df.columns:
+        raw = df[col]
+        if pd.api.types.is_datetime64_any_dtype(raw.dtype):
+            # Время уже разобрано при загрузке
+            typed[col] = raw
+            report.add(col, TIMESTAMP)
+            continue
+        if isinstance(raw.dtype, pd.CategoricalDtype):
+            # Колонка уже закодирована при загрузке (sheetload): разбираем только словарь
+            categories = pd.Series(raw.cat.categories.astype(str), dtype=object).str.strip()
+            category_codes, uniques = pd.factorize(categories.mask(categories == ''))
+            raw_codes = raw.cat.codes.to_numpy()
+            codes = np.where(raw_codes >= 0, category_codes[raw_codes], -1)
+        else:
+            text = raw.astype(str).str.strip()
+            text = text.mask(raw.isna() | (text == ''))
+            codes, uniques = pd.factorize(text)
+        uniques = pd.Index(uniques, dtype=object)
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+
+        kind, scale = hints.get(col), None
+        if kind is None:
+            kind, scale = _infer(pd.Series(uniques, dtype=object), counts, rows, scales)
+        elif kind == ORDINAL:
+            scale = next((s for s in scales if uniques.isin(s).any()), None)
+            if scale is None:
+                kind = NOMINAL
+
+        missing = codes < 0
+        if not len(uniques):
+            # Пустая колонка: типизировать нечего
+            typed[col] = pd.Series(np.nan, index=df.index, name=col, dtype=float if kind == NUMERIC else object)
+            report.add(col, kind)
+            continue
+        if kind == NUMERIC:
+            parsed = _parse_numbers(pd.Series(uniques, dtype=object), extract=col in hints)
+            values = np.where(missing, np.nan, parsed[codes])
+            bad = np.isnan(parsed)
+            series = pd.Series(values, index=df.index, name=col)
+            if not np.isnan(values).all() and (values[~np.isnan(values)] % 1 == 0).all():
+                series = series.astype('Int64')
+        elif kind == TIMESTAMP:
+            parsed = _parse_timestamps(uniques)
+            bad = np.asarray(parsed.isna())
+            series = pd.Series(parsed.take(codes, allow_fill=True, fill_value=pd.NaT), index=df.index, name=col)
+        elif kind == ORDINAL:
+            extras = [u for u in uniques if u not in scale]
+            categories = list(scale) + extras
+            mapped = pd.Index(categories).get_indexer(uniques)
+            series = pd.Series(pd.Categorical.from_codes(
+                np.where(missing, -1, mapped[codes]), categories, ordered=True,
+            ), index=df.index, name=col)
+            # Значения вне шкалы сохраняем (в конце шкалы), но сообщаем о них
+            bad = ~uniques.isin(scale)
+        elif kind == NOMINAL:
+            series = pd.Series(pd.Categorical.from_codes(codes, uniques), index=df.index, name=col)
+            bad = np.zeros(len(uniques), dtype=bool)
+        else:
+            values = np.asarray(uniques, dtype=object)[codes]
+            values[missing] = None
+            series = pd.Series(values, index=df.index, name=col, dtype=object)
+            bad = np.zeros(len(uniques), dtype=bool)
+
+        typed[col] = series
+        bad = np.asarray(bad, dtype=bool)
+        report.add(col, kind, int(counts[bad].sum()), _examples(uniques, bad))
+    return pd.DataFrame(typed, index=df.index), report
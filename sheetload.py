@@ -0,0 +1,146 @@
+"""Постраничная загрузка листа Google Sheets сразу в колонки.
+
+get_all_records() строит словарь на каждую строку с повтором всех заголовков,
+а pd.DataFrame потом копирует его целиком - пик памяти в разы больше данных.
+Здесь лист читается диапазонами по batch_rows строк как списки значений,
+каждая колонка сразу кодируется (узкий целочисленный код + словарь уникальных),
+колонки с уникальными значениями (время) разбираются сразу, и сырая пачка
+выбрасывается до чтения следующей. Результат - DataFrame категориальных колонок,
+который apply_schema типизирует по словарям, не разворачивая строки.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+
+class ColumnBuilder:
+    """Коды значений одной колонки пачками и общий словарь значение -> код"""
+
+    def __init__(self, name):
+        self.name = name
+        self.lookup = {}
+        self.chunks = []
+
+    def extend(self, values):
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        lookup = self.lookup
+        mapping = np.fromiter((lookup.setdefault(u, len(lookup)) for u in uniques),
+                              dtype=np.int32, count=len(uniques))
+        # Коды храним в самом узком типе, которого хватает на словарь
+        dtype = np.int8 if len(lookup) < 2**7 else np.int16 if len(lookup) < 2**15 else np.int32
+        self.chunks.append((mapping[codes] if len(mapping) else codes).astype(dtype))
+
+    def build(self, index):
+        codes = np.concatenate(self.chunks) if self.chunks else np.empty(0, dtype=np.int8)
+        self.chunks = []
+        return pd.Series(pd.Categorical.from_codes(codes, list(self.lookup)), index=index, name=self.name)
+
+
+class ParsedColumnBuilder:
+    """Колонка, которую выгоднее разобрать сразу (время - уникально почти в каждой строке)"""
+
+    def __init__(self, name, parse):
+        self.name = name
+        self.parse = parse
+        self.chunks = []
+
+    def extend(self, values):
+        self.chunks.append(self.parse(values))
+
+    def build(self, index):
+        values = np.concatenate(self.chunks) if self.chunks else self.parse([])
+        self.chunks = []
+        return pd.Series(values, index=index, name=self.name)
+
+
+def _unique_headers(header):
+    # Пустые и повторяющиеся заголовки сохраняем под уникальными именами
+    seen = {}
+    names = []
+    for i, name in enumerate(header):
+        name = str(name).strip() or f"Колонка {i + 1}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name} ({seen[name]})"
+        else:
+            seen[name] = 1
+        names.append(name)
+    return names
+
+
+class WorksheetReader:
+    """Загрузка листа по шагам: next_range() -> запрос к API -> add(значения) -> ... -> build()
+
+    Запросы к API делает вызывающий код, поэтому у каждой страницы может быть свой
+    таймаут и свои повторы. Первая строка листа - заголовки. Страницы читаются, пока
+    API не вернёт пустую страницу или не будет достигнут row_count (размер листа):
+    короткая страница - не конец, API обрезает пустые строки в конце диапазона.
+    """
+
+    def __init__(self, batch_rows=5000, parsers=None, row_count=None):
+        self.batch_rows = batch_rows
+        self.parsers = parsers or {}
+        self.row_count = row_count
+        self.builders = None
+        self.rows = 0
+        self.requests = 0
+        self.finished = False
+        self._width = 0
+        self._next_row = 2
+        self._started = time.perf_counter()
+
+    def next_range(self):
+        """Диапазон следующего запроса ('1:1', '2:5001', ...) или None, если лист прочитан"""
+        if self.finished:
+            return None
+        if self.builders is None:
+            return '1:1'
+        return f'{self._next_row}:{self._next_row + self.batch_rows - 1}'
+
+    def add(self, values):
+        self.requests += 1
+        if self.builders is None:
+            if not values or not values[0]:
+                self.finished = True
+                return
+            names = _unique_headers(values[0])
+            self._width = len(names)
+            self.builders = [ParsedColumnBuilder(name, self.parsers[name]) if name in self.parsers
+                             else ColumnBuilder(name) for name in names]
+            return
+        if not values:
+            self.finished = True
+            return
+        width = self._width
+        # Пустые ячейки в конце строки API не возвращает - дополняем до ширины заголовка
+        columns = zip(*(row[:width] + [''] * (width - len(row)) for row in values))
+        for builder, column in zip(self.builders, columns):
+            builder.extend(column)
+        self.rows += len(values)
+        self._next_row += self.batch_rows
+        if self.row_count is not None and self._next_row > self.row_count:
+            self.finished = True
+
+    def build(self):
+        """DataFrame категориальных колонок из прочитанных страниц"""
+        if self.builders is None:
+            return pd.DataFrame()
+        index = pd.RangeIndex(self.rows)
+        df = pd.DataFrame({b.name: b.build(index) for b in self.builders}, index=index)
+        elapsed = time.perf_counter() - self._started
+        print(f"Загрузка листа: {self.rows} строк за {elapsed:.2f} с ({self.rows / max(elapsed, 1e-9):.0f} строк/с), "
+              f"{self.requests} запросов, {df.memory_usage(deep=True).sum() / 2**20:.1f} МБ")
+        return df
+
+
+def read_worksheet(sheet, batch_rows=5000, parsers=None):
+    """DataFrame категориальных колонок из листа за один вызов; первая строка - заголовки
+
+    parsers - {заголовок: функция(список строк) -> массив} для колонок, которые
+    разбираются сразу по пачкам, а не кодируются словарём.
+    """
+    reader = WorksheetReader(batch_rows, parsers, getattr(sheet, 'row_count', None))
+    while (cell_range := reader.next_range()) is not None:
+        reader.add(sheet.get_values(cell_range))
+    return reader.build()
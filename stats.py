@@ -0,0 +1,119 @@
+"""Доверительные интервалы для долей положительных ответов (бутстрап на NumPy).
+
+Для ответов вида «да/нет» среднее бутстрап-выборки из n ответов распределено
+ровно как Binomial(n, p)/n, поэтому вместо выборки индексов сразу генерируются
+количества: все ресэмплы по всем метрикам и сегментам - один вызов rng.binomial
+над массивом (метрика x сегмент x ресэмпл). Время не зависит от числа анкет,
+от него зависит только подсчёт исходных количеств (np.bincount).
+"""
+import numpy as np
+import pandas as pd
+
+ALL = 'Все'
+
+
+class QualityStats:
+    """Доли, интервалы и значимость отличий сегмента от остальных
+
+    Массивы имеют форму (метрика, сегмент); сегмент 0 - все ответы.
+    """
+
+    def __init__(self, metrics, segments, positives, totals, low, high, diff_low, diff_high, confidence):
+        self.metrics = metrics
+        self.segments = segments
+        self.positives = positives
+        self.totals = totals
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.rates = np.where(totals > 0, positives / np.maximum(totals, 1), np.nan)
+        self.low = low
+        self.high = high
+        self.diff_low = diff_low
+        self.diff_high = diff_high
+        self.confidence = confidence
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.positives, self.totals, self.rates, self.low,
+                                      self.high, self.diff_low, self.diff_high))
+
+    def overall(self, metric):
+        """(доля, нижняя, верхняя граница, число ответов) по всем анкетам"""
+        m = self.metrics.index(metric)
+        return self.rates[m, 0], self.low[m, 0], self.high[m, 0], int(self.totals[m, 0])
+
+    def differences(self, metric, dimension, min_effect=0.0):
+        """Сегменты измерения, значимо отличающиеся от остальных: [(значение, доля, +1/-1)]
+
+        min_effect - минимальная разница долей: на больших выборках значимы и отличия
+        в доли процента, которые на практике ничего не значат.
+        """
+        m = self.metrics.index(metric)
+        result = []
+        for s, (dim, value) in enumerate(self.segments):
+            if dim != dimension:
+                continue
+            if self.diff_low[m, s] > min_effect:
+                result.append((value, self.rates[m, s], 1))
+            elif self.diff_high[m, s] < -min_effect:
+                result.append((value, self.rates[m, s], -1))
+        return result
+
+
+def _segment_codes(series, max_segments):
+    """Коды топ-N значений колонки (остальные и пропуски -> -1) и сами значения"""
+    counts = series.value_counts()
+    counts = counts[counts > 0].head(max_segments)
+    values = list(counts.index)
+    codes = pd.Index(values, dtype=object).get_indexer(series.to_numpy(dtype=object))
+    return codes.astype(np.int64), values
+
+
+def compute_quality_stats(df, metrics, dimensions, n_resamples=2000, confidence=0.95,
+                          max_segments=10, min_answers=1, seed=0):
+    """metrics - {название: (колонка, положительные ответы)}, dimensions - {название: колонка}"""
+    metrics = {name: spec for name, spec in metrics.items() if spec[0] in df.columns}
+    segments = [(ALL, ALL)]
+    segment_codes = []
+    for dim, column in dimensions.items():
+        if column not in df.columns:
+            continue
+        codes, values = _segment_codes(df[column], max_segments)
+        segment_codes.append((len(segments), codes, len(values)))
+        segments += [(dim, value) for value in values]
+
+    names = list(metrics)
+    shape = (len(names), len(segments))
+    positives = np.zeros(shape, dtype=np.int64)
+    totals = np.zeros(shape, dtype=np.int64)
+    for m, name in enumerate(names):
+        column, positive = metrics[name]
+        answered = df[column].notna().to_numpy()
+        is_positive = df[column].isin(positive).to_numpy() & answered
+        positives[m, 0], totals[m, 0] = is_positive.sum(), answered.sum()
+        for offset, codes, size in segment_codes:
+            valid = codes >= 0
+            totals[m, offset:offset + size] = np.bincount(codes[valid & answered], minlength=size)
+            positives[m, offset:offset + size] = np.bincount(codes[valid & is_positive], minlength=size)
+
+    # Сегмент против всех остальных ответов - для проверки значимости отличия
+    rest_positives = positives[:, :1] - positives
+    rest_totals = totals[:, :1] - totals
+
+    n = np.concatenate([totals, rest_totals], axis=1)
+    k = np.concatenate([positives, rest_positives], axis=1)
+    p = np.where(n > 0, k / np.maximum(n, 1), 0.0)
+    rng = np.random.default_rng(seed)
+    # Один батч: (метрика, сегмент + остальные, ресэмпл)
+    samples = rng.binomial(n[..., None], p[..., None], size=n.shape + (n_resamples,)) / np.maximum(n, 1)[..., None]
+
+    alpha = (1 - confidence) / 2
+    seg_samples, rest_samples = samples[:, :len(segments)], samples[:, len(segments):]
+    low, high = np.quantile(seg_samples, [alpha, 1 - alpha], axis=2)
+    diff_low, diff_high = np.quantile(seg_samples - rest_samples, [alpha, 1 - alpha], axis=2)
+
+    # Без ответов (или без "остальных") интервала нет, отличие не значимо
+    empty = totals < min_answers
+    low[empty], high[empty] = np.nan, np.nan
+    no_diff = empty | (rest_totals < min_answers)
+    diff_low[no_diff], diff_high[no_diff] = -np.inf, np.inf
+    return QualityStats(names, segments, positives, totals, low, high, diff_low, diff_high, confidence)
@@ -0,0 +1,176 @@
+"""Реестр опросов: снимки таблиц и производные индексы под общим бюджетом памяти.
+
+Опрос загружается лениво при первом обращении, снимок живёт SURVEY_TTL секунд,
+холодные опросы вытесняются по LRU, когда суммарный размер снимков превышает бюджет.
+"""
+import asyncio
+import sys
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+
+from resilience import Deadline
+
+Survey = namedtuple('Survey', ['name', 'sheet_id', 'worksheet'])
+
+
+def parse_surveys(spec, default_worksheet):
+    """Разбирает строку вида 'Москва Q1=<sheet_id>:<лист>; СПб=<sheet_id>' в список Survey"""
+    surveys = []
+    for item in spec.split(';'):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, target = item.rpartition('=')
+        sheet_id, _, worksheet = target.partition(':')
+        surveys.append(Survey(name.strip() or sheet_id.strip(), sheet_id.strip(), worksheet.strip() or default_worksheet))
+    return surveys
+
+
+def estimate_nbytes(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, tuple):
+        return sum(estimate_nbytes(v) for v in value)
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+class Snapshot:
+    """Загруженная версия опроса и посчитанные по ней производные данные"""
+
+    _versions = 0
+
+    def __init__(self, survey, df, on_grow=None, previous=None):
+        Snapshot._versions += 1
+        self.survey = survey
+        self.df = df
+        self.version = Snapshot._versions
+        self.loaded_at = time.time()
+        # Возраст снимка - по монотонным часам: перевод системного времени не ломает TTL
+        self._loaded = time.monotonic()
+        self._derived = {}
+        self._on_grow = on_grow
+        self.nbytes = estimate_nbytes(df)
+        self._carry = {}
+        if previous is not None and previous.df.equals(df):
+            # Данные не изменились - всё посчитанное по прошлой версии остаётся верным
+            self._derived = dict(previous._derived)
+            self.nbytes = previous.nbytes
+        elif previous is not None:
+            # Инкрементальные индексы прошлой версии дообновляются, а не строятся заново
+            self._carry = {
+                name: value for name, value in previous._derived.items() if getattr(value, 'incremental', False)
+            }
+
+    @property
+    def age(self):
+        return time.monotonic() - self._loaded
+
+    def derived(self, name, build):
+        """Производное значение (индекс, агрегаты, кэш графика), считается один раз на снимок
+
+        Если данные не изменились с прошлой версии, значение берётся из неё как есть.
+        Если значение прошлой версии помечено incremental, вместо build
+        вызывается его метод refresh(df).
+        """
+        if name not in self._derived:
+            carried = self._carry.pop(name, None)
+            value = carried.refresh(self.df) if carried is not None else build(self.df)
+            self._derived[name] = value
+            self.nbytes += estimate_nbytes(value)
+            if self._on_grow:
+                self._on_grow()
+        return self._derived[name]
+
+    def peek(self, name):
+        """Уже посчитанное производное значение или None - без вызова build"""
+        return self._derived.get(name)
+
+
+class SurveyRegistry:
+    """LRU-кэш снимков опросов с бюджетом памяти и ленивой перезагрузкой
+
+    load - корутина load(survey, deadline) -> DataFrame (с таймаутами и ретраями),
+    ingest - необязательная обработка сырого DataFrame перед сохранением снимка
+    (выполняется в потоке, не в event loop).
+    Загрузка общая для всех, кто ждёт опрос, поэтому её бюджет - load_budget
+    секунд, а не дедлайн одного из запросов; каждый ждёт её не дольше своего дедлайна.
+    """
+
+    def __init__(self, load, memory_budget, ttl=60.0, ingest=None, load_budget=120.0):
+        self._load = load
+        self._ingest = ingest
+        self.memory_budget = memory_budget
+        self.ttl = ttl
+        self.load_budget = load_budget
+        self._snapshots = OrderedDict()
+        self._loading = {}
+
+    @property
+    def nbytes(self):
+        return sum(s.nbytes for s in self._snapshots.values())
+
+    def peek(self, survey):
+        return self._snapshots.get(survey)
+
+    async def get(self, survey, deadline=None):
+        """Возвращает (snapshot, stale_since). При ошибке загрузки отдаёт старый снимок или None"""
+        snapshot = self._snapshots.get(survey)
+        if snapshot is not None:
+            self._snapshots.move_to_end(survey)
+            if snapshot.age < self.ttl:
+                return snapshot, None
+        # Один запрос к таблице на опрос, даже если его ждут несколько чатов
+        task = self._loading.get(survey)
+        if task is None:
+            task = asyncio.ensure_future(self._reload(survey, Deadline(self.load_budget)))
+            self._loading[survey] = task
+            task.add_done_callback(lambda t: self._loaded(survey, t))
+        try:
+            if deadline is None:
+                return await asyncio.shield(task), None
+            return await asyncio.wait_for(asyncio.shield(task), deadline.remaining()), None
+        except asyncio.TimeoutError as e:
+            # До 3.11 это не встроенный TimeoutError. Таймаутом может закончиться и сама загрузка
+            if task.done():
+                print(f"Не удалось загрузить опрос '{survey.name}': {e!r}")
+            else:
+                print(f"Опрос '{survey.name}' не успел загрузиться к дедлайну запроса, загрузка продолжается")
+        except Exception as e:
+            print(f"Не удалось загрузить опрос '{survey.name}': {e!r}")
+        if snapshot is not None:
+            return snapshot, snapshot.loaded_at
+        return None, None
+
+    def _loaded(self, survey, task):
+        self._loading.pop(survey, None)
+        # Ошибка уже напечатана ожидавшими; забираем её, чтобы asyncio не ругался на непрочитанную
+        if not task.cancelled():
+            task.exception()
+
+    async def _reload(self, survey, deadline):
+        df = await self._load(survey, deadline)
+        if self._ingest is not None:
+            # Типизация и нормализация - в потоке: на больших таблицах это секунды
+            df = await asyncio.to_thread(self._ingest, df)
+        snapshot = Snapshot(survey, df, on_grow=self._enforce_budget, previous=self._snapshots.get(survey))
+        self._snapshots[survey] = snapshot
+        self._snapshots.move_to_end(survey)
+        self._enforce_budget()
+        return snapshot
+
+    def _enforce_budget(self):
+        # Самый свежий по обращению опрос не вытесняем, даже если он один больше бюджета
+        while len(self._snapshots) > 1 and self.nbytes > self.memory_budget:
+            survey, snapshot = self._snapshots.popitem(last=False)
+            print(f"Опрос '{survey.name}' вытеснен из памяти ({snapshot.nbytes / 2**20:.1f} МБ)")
@@ -2,26 +2,71 @@ import os
 import pandas as pd
 import matplotlib
 matplotlib.use('Agg')  # Для работы без GUI
-import matplotlib.pyplot as plt
 import re
 from telegram import Update, ReplyKeyboardMarkup
+from telegram.helpers import escape_markdown
 from telegram.ext import Application, CommandHandler, MessageHandler, ContextTypes, filters
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from dotenv import load_dotenv
 from difflib import get_close_matches
 import openai
+import asyncio
 import io
-import seaborn as sns
+import time
+from collections import OrderedDict
+from functools import partial
+from resilience import Deadline, Dependency, CircuitBreaker
+from charts import ChartRenderer
+from surveys import Survey, SurveyRegistry, parse_surveys
+from banks import BankNormalizer
+from stats import compute_quality_stats
+from sheetload import WorksheetReader
+from jobs import JobFailed, JobLimitError, ReportQueue
+from delivery import Delivery
+from export import ExportError, Exporter
+from profiling import Profiler
+from schema import NUMERIC, NOMINAL, TIMESTAMP, TIMESTAMP_FORMAT, apply_schema, column_kind, parse_timestamps
+from trends import TIMESTAMP_COLUMN, TrendIndex, rate_metric, mean_metric, minutes_metric
 
 load_dotenv()
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 SHEET_ID = os.getenv('SHEET_ID')
 GOOGLE_JSON = os.getenv('GOOGLE_JSON_PATH', 'medical-462021-78bf30c680aa.json')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+WORKSHEET_NAME = os.getenv('WORKSHEET_NAME', 'Ответы на форму')
 
-# Создаём клиента OpenAI (глобально)
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+# Бюджет времени на один запрос пользователя и таймауты зависимостей (секунды)
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', '25'))
+SHEETS_TIMEOUT = float(os.getenv('SHEETS_TIMEOUT', '10'))
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '20'))
+# Сколько строк таблицы читается одним запросом к Google Sheets
+SHEETS_BATCH_ROWS = int(os.getenv('SHEETS_BATCH_ROWS', '5000'))
+
+# Сколько апдейтов обрабатывается одновременно. По умолчанию 1 - строго по очереди, как в PTB:
+# при большем значении сообщения одного чата могут обрабатываться вперемешку
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '1'))
+
+# Опросы: основной из SHEET_ID и дополнительные из SURVEYS ("Имя=<sheet_id>:<лист>; ...")
+SURVEYS = ([Survey('Основной', SHEET_ID, WORKSHEET_NAME)] if SHEET_ID else []) + parse_surveys(
+    os.getenv('SURVEYS', ''), WORKSHEET_NAME
+)
+SURVEY_TTL = float(os.getenv('SURVEY_TTL', '60'))
+# Бюджет на одну загрузку опроса (с): она общая для всех ждущих чатов, каждый ждёт не дольше REQUEST_DEADLINE
+SURVEY_LOAD_BUDGET = float(os.getenv('SURVEY_LOAD_BUDGET', '120'))
+SURVEY_MEMORY_BUDGET = int(float(os.getenv('SURVEY_MEMORY_BUDGET_MB', '256')) * 2**20)
+
+# Выгрузка таблиц в файл: формат по умолчанию
+EXPORT_FORMAT = os.getenv('EXPORT_FORMAT', 'xlsx')
+# Бот может отправить файл не больше 50 МБ
+TELEGRAM_FILE_LIMIT = 50 * 2**20
+
+# Администраторы (id пользователей Telegram через запятую) - им доступна команда /profile
+ADMIN_IDS = {int(x) for x in os.getenv('ADMIN_IDS', '').replace(' ', '').split(',') if x}
+
+# Последние ответы GPT по тексту запроса (отдаём, если OpenAI недоступен)
+GPT_CACHE_SIZE = 128
+_gpt_cache = OrderedDict()
 
 COLUMN_SYNONYMS = {
     "тип обращения": "С какой целью вы посетили отделение банка?",
@@ -44,33 +89,249 @@ COLUMN_SYNONYMS = {
     "возраст": "Укажите ваш возраст.",
 }
 
-def get_df_from_gsheet():
-    try:
-        scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-        
-        # Сначала пробуем получить из переменной окружения
-        google_credentials = os.getenv('GOOGLE_CREDENTIALS')
-        if google_credentials:
-            import json
-            creds = ServiceAccountCredentials.from_json_keyfile_dict(
-                json.loads(google_credentials), scope
-            )
+# Положительные ответы для метрик качества и рекомендации
+POSITIVE_ANSWERS = {
+    'вежливость': ['Очень вежливы', 'Вежливы'],
+    'компетентность': ['Высокая', 'Очень высокая'],
+    'понятно': ['Очень понятно', 'Понятно'],
+    'чистота': ['Отлично', 'Хорошо'],
+    'доступность': ['Очень доступна', 'Доступна'],
+    'терминал': ['Очень удобно', 'Удобно'],
+    'рекомендация': ['Определенно да', 'Скорее да'],
+}
+
+QUALITY_METRICS = ['вежливость', 'компетентность', 'понятно', 'чистота', 'доступность', 'терминал']
+
+QUALITY_LABELS = {
+    'вежливость': 'Вежливость сотрудников',
+    'компетентность': 'Компетентность сотрудников',
+    'понятно': 'Понятность объяснений',
+    'чистота': 'Чистота и комфорт',
+    'доступность': 'Доступность информации',
+    'терминал': 'Удобство терминалов',
+    'рекомендация': 'Готовность рекомендовать',
+}
+
+# Короткие подписи метрик для панели качества на дашборде
+DASHBOARD_LABELS = {
+    'вежливость': 'Вежливость',
+    'компетентность': 'Компетентность',
+    'понятно': 'Понятность',
+    'чистота': 'Чистота',
+    'доступность': 'Доступность инф.',
+    'терминал': 'Терминалы',
+    'рекомендация': 'Рекомендация',
+}
+
+# Сегменты, в которых ищем значимые отличия метрик качества
+QUALITY_SEGMENTS = {
+    'банк': '🏦 *Различия между банками:*',
+    'пол': '👥 *Различия между мужчинами и женщинами:*',
+}
+
+BOOTSTRAP_RESAMPLES = int(os.getenv('BOOTSTRAP_RESAMPLES', '2000'))
+# Отличия меньше 5 п.п. не показываем, даже если они значимы
+QUALITY_MIN_EFFECT = 0.05
+
+# Шкалы ответов от худшего к лучшему (колонки с такими ответами типизируются как ordinal)
+ORDINAL_SCALES = [
+    ['Невежливы', 'Нейтрально', 'Вежливы', 'Очень вежливы'],
+    ['Низкая', 'Средняя', 'Высокая', 'Очень высокая'],
+    ['Непонятно', 'Не совсем понятно', 'Понятно', 'Очень понятно'],
+    ['Плохо', 'Удовлетворительно', 'Хорошо', 'Отлично'],
+    ['Недоступна', 'Малодоступна', 'Доступна', 'Очень доступна'],
+    ['Не пользуюсь', 'Неудобно', 'Удобно', 'Очень удобно'],
+    ['Определенно нет', 'Скорее нет', 'Скорее да', 'Определенно да'],
+    ['Более 20 минут', '10-20 минут', '5-10 минут', 'Менее 5 минут'],
+]
+
+# Колонки, тип которых известен заранее (остальные определяются по значениям)
+SCHEMA_HINTS = {
+    TIMESTAMP_COLUMN: TIMESTAMP,
+    COLUMN_SYNONYMS['возраст']: NUMERIC,
+    COLUMN_SYNONYMS['банк']: NOMINAL,
+}
+
+# Метрики для индекса динамики: название -> функция значений по строкам
+TREND_METRICS = {
+    key: rate_metric(COLUMN_SYNONYMS[key], POSITIVE_ANSWERS[key]) for key in QUALITY_METRICS + ['рекомендация']
+}
+TREND_METRICS['удовлетворенность'] = mean_metric(*(TREND_METRICS[key] for key in QUALITY_METRICS))
+TREND_METRICS['ожидание'] = minutes_metric(COLUMN_SYNONYMS['очередь'])
+
+# Слова в запросе -> метрика динамики (проверяются по порядку)
+TREND_KEYWORDS = [
+    ('рекоменд', 'рекомендация'),
+    ('ожидан', 'ожидание'),
+    ('очеред', 'ожидание'),
+    ('удовлетвор', 'удовлетворенность'),
+    ('качеств', 'удовлетворенность'),
+    ('вежлив', 'вежливость'),
+    ('компетент', 'компетентность'),
+    ('понятн', 'понятно'),
+    ('чистот', 'чистота'),
+    ('доступн', 'доступность'),
+    ('терминал', 'терминал'),
+]
+
+TREND_PERIODS = [('недел', 7), ('месяц', 30), ('квартал', 91), ('год', 365)]
+
+TREND_TITLES = {
+    'вежливость': 'Вежливость сотрудников',
+    'компетентность': 'Компетентность сотрудников',
+    'понятно': 'Понятность объяснений',
+    'чистота': 'Чистота и комфорт',
+    'доступность': 'Доступность информации',
+    'терминал': 'Удобство терминалов',
+    'рекомендация': 'Готовность рекомендовать',
+    'удовлетворенность': 'Удовлетворенность качеством',
+    'ожидание': 'Время ожидания в очереди',
+}
+
+def open_worksheet(sheet_id, worksheet_name):
+    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+    
+    # Сначала пробуем получить из переменной окружения
+    google_credentials = os.getenv('GOOGLE_CREDENTIALS')
+    if google_credentials:
+        import json
+        creds = ServiceAccountCredentials.from_json_keyfile_dict(
+            json.loads(google_credentials), scope
+        )
+    else:
+        # Fallback к файлу (для локальной разработки)
+        if not os.path.exists(GOOGLE_JSON):
+            raise RuntimeError(f"Файл {GOOGLE_JSON} не найден и GOOGLE_CREDENTIALS не установлен")
+        creds = ServiceAccountCredentials.from_json_keyfile_name(GOOGLE_JSON, scope)
+    
+    gc = gspread.authorize(creds)
+    gc.set_timeout(SHEETS_TIMEOUT)
+    return gc.open_by_key(sheet_id).worksheet(worksheet_name)
+
+async def fetch_survey(survey, deadline):
+    """Загружает таблицу опроса постранично в колонки. Ошибки не глотает - их обрабатывает реестр опросов
+
+    Каждый запрос к Sheets - отдельный вызов со своим таймаутом SHEETS_TIMEOUT и повторами:
+    при сбое повторяется одна страница, а не вся загрузка. Общий бюджет - deadline.
+    """
+    sheet = await sheets_dependency.call(open_worksheet, survey.sheet_id, survey.worksheet, deadline=deadline)
+    reader = WorksheetReader(SHEETS_BATCH_ROWS, parsers={TIMESTAMP_COLUMN: parse_timestamps},
+                             row_count=getattr(sheet, 'row_count', None))
+    while (cell_range := reader.next_range()) is not None:
+        values = await sheets_dependency.call(sheet.get_values, cell_range, deadline=deadline)
+        # Разбор страницы - в потоке, event loop занят только ожиданием
+        await asyncio.to_thread(reader.add, values)
+    return await asyncio.to_thread(reader.build)
+
+def ingest_survey(df):
+    """Подготовка снимка: типизация колонок по схеме и нормализация названий банков"""
+    df, report = apply_schema(df, hints=SCHEMA_HINTS, scales=ORDINAL_SCALES)
+    # В лог - только колонки с нераспознанными значениями, а не сводка на каждую перезагрузку
+    if report.errors:
+        print(report.summary())
+    bank_col = COLUMN_SYNONYMS['банк']
+    if bank_col in df.columns:
+        df[bank_col] = bank_normalizer.normalize(df[bank_col])
+        bank_normalizer.save()
+    return df
+
+# Процессы выгрузки (spawn) заново импортируют главный модуль как __mp_main__. Им нужны только
+# функции export.py, поэтому клиенты, пулы потоков и очереди бота создаются лишь в процессе бота
+if __name__ != '__mp_main__':
+    # Создаём клиента OpenAI (глобально). Ретраи делает наш слой отказоустойчивости
+    client = openai.OpenAI(api_key=OPENAI_API_KEY, timeout=OPENAI_TIMEOUT, max_retries=0)
+
+    sheets_dependency = Dependency(
+        'sheets', timeout=SHEETS_TIMEOUT, retries=2, backoff=0.5,
+        breaker=CircuitBreaker('sheets', failure_threshold=3, reset_timeout=60),
+    )
+    openai_dependency = Dependency(
+        'openai', timeout=OPENAI_TIMEOUT, retries=1, backoff=1.0, max_workers=max(4, CONCURRENT_UPDATES),
+        breaker=CircuitBreaker('openai', failure_threshold=3, reset_timeout=60),
+    )
+
+    # Графики: ширина картинки в пикселях под экран телефона и порог перехода PNG -> JPEG
+    chart_renderer = ChartRenderer(
+        target_width=int(os.getenv('CHART_TARGET_WIDTH', '1080')),
+        max_bytes=int(os.getenv('CHART_MAX_BYTES', '200000')),
+    )
+
+    # Отправка в Telegram: очередь на чат, альбомы из графиков, лимиты частоты (на чат и на бота)
+    delivery = Delivery(
+        chat_rate=float(os.getenv('TELEGRAM_CHAT_RATE', '1')),
+        chat_burst=int(os.getenv('TELEGRAM_CHAT_BURST', '5')),
+        global_rate=float(os.getenv('TELEGRAM_GLOBAL_RATE', '30')),
+    )
+
+    # Тяжёлые отчёты строятся в фоне: воркеров, мест в очереди, активных отчётов на чат, таймаут (с)
+    report_queue = ReportQueue(
+        workers=int(os.getenv('REPORT_WORKERS', '2')),
+        max_queued=int(os.getenv('REPORT_QUEUE_SIZE', '50')),
+        per_chat=int(os.getenv('REPORT_JOBS_PER_CHAT', '2')),
+        timeout=float(os.getenv('REPORT_TIMEOUT', '300')),
+    )
+
+    # Выгрузки: каталог для файлов и число процессов-воркеров
+    exporter = Exporter(
+        directory=os.getenv('EXPORT_DIR', 'exports'),
+        workers=int(os.getenv('EXPORT_WORKERS', '1')),
+    )
+
+    # Профилирование по /profile: каталог для результатов и предельная длительность (с)
+    profiler = Profiler(
+        directory=os.getenv('PROFILE_DIR', 'profiles'),
+        max_seconds=float(os.getenv('PROFILE_MAX_SECONDS', '300')),
+    )
+
+    # Словарь "как написали" -> "каноническое название банка", пополняется новыми вариантами
+    bank_normalizer = BankNormalizer(os.getenv('BANK_ALIASES_PATH', 'bank_aliases.json'))
+
+    survey_registry = SurveyRegistry(
+        fetch_survey, SURVEY_MEMORY_BUDGET, ttl=SURVEY_TTL, ingest=ingest_survey, load_budget=SURVEY_LOAD_BUDGET,
+    )
+
+def current_survey(context):
+    """Опрос, выбранный в этом чате (по умолчанию - первый из списка)"""
+    name = context.chat_data.get('survey')
+    for survey in SURVEYS:
+        if survey.name == name:
+            return survey
+    return SURVEYS[0] if SURVEYS else None
+
+async def select_survey(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/survey - список опросов, /survey <номер или название> - выбрать опрос для чата"""
+    if not SURVEYS:
+        delivery.reply_text(update.message, "Ошибка: не настроены опросы (SHEET_ID или SURVEYS)")
+        return
+    current = current_survey(context)
+    if context.args:
+        query = ' '.join(context.args).strip()
+        chosen = None
+        if query.isdigit() and 1 <= int(query) <= len(SURVEYS):
+            chosen = SURVEYS[int(query) - 1]
         else:
-            # Fallback к файлу (для локальной разработки)
-            if not os.path.exists(GOOGLE_JSON):
-                print(f"Файл {GOOGLE_JSON} не найден и GOOGLE_CREDENTIALS не установлен")
-                return pd.DataFrame()
-            creds = ServiceAccountCredentials.from_json_keyfile_name(GOOGLE_JSON, scope)
-        
-        client = gspread.authorize(creds)
-        sheet = client.open_by_key(SHEET_ID).worksheet("Ответы на форму")
-        data = sheet.get_all_records()
-        return pd.DataFrame(data)
-    except Exception as e:
-        print(f"Ошибка при получении данных из Google Sheets: {e}")
-        return pd.DataFrame()
+            matches = [s for s in SURVEYS if query.lower() in s.name.lower()]
+            chosen = matches[0] if matches else None
+        if chosen is None:
+            delivery.reply_text(update.message, f"Опрос '{query}' не найден. Список: /survey")
+            return
+        context.chat_data['survey'] = chosen.name
+        delivery.reply_text(update.message, f"✅ Выбран опрос: {chosen.name}")
+        return
+    text = "📋 *Доступные опросы:*\n\n"
+    for i, survey in enumerate(SURVEYS, 1):
+        mark = "👉 " if survey == current else ""
+        snapshot = survey_registry.peek(survey)
+        loaded = f" - в памяти, {len(snapshot.df)} анкет" if snapshot is not None else ""
+        # Названия приходят из настроек и могут содержать _ или * - экранируем под Markdown
+        text += f"{mark}{i}. {escape_markdown(survey.name)}{loaded}\n"
+    text += "\nВыбрать: /survey <номер или название>"
+    delivery.reply_text(update.message, text, parse_mode='Markdown')
 
 def extract_numeric(series):
+    # Колонки снимка уже типизированы схемой - повторно строки не разбираем
+    if column_kind(series) == NUMERIC:
+        return series
     return pd.to_numeric(series.astype(str).str.extract('(\d+)')[0], errors='coerce')
 
 def find_column_by_synonym(df, text):
@@ -95,76 +356,40 @@ def find_column_fuzzy(df, text):
             return c
     return None
 
+def answer_counts(series):
+    """value_counts() типизированной колонки в том же виде, что и по строкам таблицы
+
+    У шкал категории - вся шкала, поэтому неотвеченные варианты отбрасываем;
+    равные количества идут в порядке первого появления, время - в формате таблицы.
+    """
+    counts = series.value_counts(sort=False)
+    counts = counts[counts > 0]
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        counts = counts.reindex(pd.Index(series.dropna().unique()))
+    counts = counts.sort_values(ascending=False, kind='stable')
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        counts.index = counts.index.strftime(TIMESTAMP_FORMAT)
+    return counts
+
 def plot_pie(df, column, title):
-    plt.style.use('seaborn-v0_8-darkgrid')
-    data = df[column].value_counts()
-    labels = [str(x)[:18] + ('...' if len(str(x)) > 18 else '') for x in data.index]
-    colors = sns.color_palette('Set3', len(data))
-    plt.figure(figsize=(5, 5))
-    wedges, texts, autotexts = plt.pie(
-        data.values,
-        labels=labels,
-        autopct='%1.1f%%',
-        startangle=140,
-        colors=colors,
-        textprops={'fontsize': 12, 'fontweight': 'bold'},
-        wedgeprops={'edgecolor': 'white'}
-    )
-    plt.title(f'🟢 {title}', fontsize=17, fontweight='bold', pad=15)
-    plt.tight_layout()
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=180, bbox_inches='tight')
-    plt.close()
-    buf.seek(0)
-    return buf
+    return chart_renderer.pie(answer_counts(df[column]), title)
 
 def plot_hist(df, column, title):
-    plt.style.use('seaborn-v0_8-darkgrid')
     data = extract_numeric(df[column]).dropna()
-    plt.figure(figsize=(8, 5))
-    ax = sns.histplot(data, bins=range(int(data.min()), int(data.max())+5, 5), color='#4C72B0', edgecolor='black', alpha=0.85)
-    ax.set_title(f'📈 {title}', fontsize=17, fontweight='bold', pad=15)
-    ax.set_xlabel(column, fontsize=13, fontweight='bold')
-    ax.set_ylabel('Количество', fontsize=13, fontweight='bold')
-    plt.xticks(fontsize=11)
-    plt.yticks(fontsize=11)
-    sns.despine()
-    plt.tight_layout()
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=180, bbox_inches='tight')
-    plt.close()
-    buf.seek(0)
-    return buf
+    return chart_renderer.hist(data.values, title, column)
 
 def plot_bar(df, column, title):
-    plt.style.use('seaborn-v0_8-darkgrid')
-    plt.figure(figsize=(9, 5))
-    data = df[column].value_counts()
-    # Обрезаем длинные подписи
-    labels = [str(x)[:18] + ('...' if len(str(x)) > 18 else '') for x in data.index]
-    ax = sns.barplot(x=labels, y=data.values, palette='Set2', edgecolor='black')
-    ax.set_title(f'📊 {title}', fontsize=18, fontweight='bold', pad=15)
-    ax.set_xlabel(column, fontsize=13, fontweight='bold')
-    ax.set_ylabel('Количество', fontsize=13, fontweight='bold')
-    plt.xticks(rotation=30, ha='right', fontsize=11)
-    plt.yticks(fontsize=11)
-    # Подписи значений
-    for i, v in enumerate(data.values):
-        ax.text(i, v + max(data.values)*0.01, str(v), ha='center', va='bottom', fontsize=11, fontweight='bold', color='#333')
-    sns.despine()
-    plt.tight_layout()
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=180, bbox_inches='tight')
-    plt.close()
-    buf.seek(0)
-    return buf
+    return chart_renderer.bar(answer_counts(df[column]), title, column)
 
 def ask_openai(question, df):
     # Подготавливаем статистику по всем колонкам для лучшего понимания данных
     stats = {}
     for col in df.columns:
-        if df[col].dtype == 'object':  # Текстовые данные
-            value_counts = df[col].value_counts()
+        kind = column_kind(df[col])
+        if kind == TIMESTAMP:
+            continue
+        if kind != NUMERIC:  # Текстовые данные и шкалы
+            value_counts = answer_counts(df[col])
             if not value_counts.empty:
                 stats[col] = {
                     'type': 'categorical',
@@ -172,8 +397,8 @@ def ask_openai(question, df):
                     'unique_values': len(value_counts),
                     'top_values': value_counts.head(3).to_dict()
                 }
-        else:  # Числовые данные
-            numeric_data = pd.to_numeric(df[col], errors='coerce').dropna()
+        else:  # Числовые данные (уже разобраны схемой)
+            numeric_data = df[col].dropna()
             if not numeric_data.empty:
                 stats[col] = {
                     'type': 'numeric',
@@ -235,7 +460,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ['👥 Гендерный состав', '📈 Возрастная статистика'],
         ['🏦 Топ банков', '💼 Цели посещения'],
         ['⭐ Оценки качества', '⏰ Время ожидания'],
-        ['🔍 Детальный анализ', '📋 Все вопросы']
+        ['🔍 Детальный анализ', '📋 Все вопросы'],
+        ['🖼 Отчет с графиками', '🧭 Дашборд']
     ]
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=False)
     
@@ -246,23 +472,27 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "• Создавать красивые графики и диаграммы\n"
         "• Проводить статистический анализ\n"
         "• Отвечать на любые вопросы по данным\n"
-        "• Давать умные рекомендации\n\n"
+        "• Давать умные рекомендации\n"
+        "• Работать с несколькими опросами: /survey\n"
+        "• Строить большие отчеты в фоне (отмена: /cancel)\n"
+        "• Выгружать таблицы в Excel, CSV и Parquet: /export\n\n"
         "💡 *Примеры запросов:*\n"
         "• \"Какие банки самые популярные?\"\n"
         "• \"Сравни мужчин и женщин\"\n"
         "• \"Анализ проблем клиентов\"\n"
         "• \"График по возрасту\"\n"
-        "• \"Качество обслуживания\"\n\n"
+        "• \"Качество обслуживания\"\n"
+        "• \"Динамика рекомендаций за месяц\"\n\n"
         "🎯 *Используйте кнопки или пишите свои вопросы!*"
     )
     
-    await update.message.reply_text(welcome_text, reply_markup=reply_markup, parse_mode='Markdown')
+    delivery.reply_text(update.message, welcome_text, reply_markup=reply_markup, parse_mode='Markdown')
 
 def get_stats_for_gpt(df):
     """Генерирует краткую статистику по всем ключевым вопросам для передачи в GPT"""
     stats = ""
     for col in df.columns:
-        val = df[col].value_counts()
+        val = answer_counts(df[col])
         if len(val) > 0:
             total = val.sum()
             top = val.idxmax()
@@ -298,56 +528,83 @@ def smart_analytics_gpt(user_query, df):
     )
     return response.choices[0].message.content
 
+def degraded_analytics(df):
+    """Ответ без GPT: только статистика по данным"""
+    stats = get_stats_for_gpt(df)
+    if len(stats) > 3500:
+        stats = stats[:3500] + "\n..."
+    return "⚠️ AI-комментарий сейчас недоступен, вот основные цифры:" + stats
+
+async def gpt_commentary(user_query, df, deadline):
+    """smart_analytics_gpt с таймаутом и ретраями; при сбое - кэш или ответ без GPT"""
+    try:
+        reply = await openai_dependency.call(smart_analytics_gpt, user_query, df, deadline=deadline)
+    except Exception as e:
+        print(f"Ошибка OpenAI: {e!r}")
+        cached = _gpt_cache.get(user_query)
+        if cached is not None:
+            return cached + "\n\n⚠️ Ответ из кэша: AI-аналитик временно недоступен"
+        return degraded_analytics(df)
+    _gpt_cache[user_query] = reply
+    _gpt_cache.move_to_end(user_query)
+    if len(_gpt_cache) > GPT_CACHE_SIZE:
+        _gpt_cache.popitem(last=False)
+    return reply
+
+async def load_snapshot(update, context, deadline):
+    """Снимок опроса чата; None (с сообщением пользователю), если данных нет"""
+    snapshot, stale_since = await survey_registry.get(current_survey(context), deadline)
+    df = snapshot.df if snapshot is not None else pd.DataFrame()
+    
+    # Проверяем, что данные получены
+    if df.empty:
+        delivery.reply_text(update.message, "Ошибка: не удалось получить данные из таблицы")
+        return None
+    if stale_since:
+        delivery.reply_text(update.message,
+            f"⚠️ Таблица временно недоступна, показываю данные на {time.strftime('%d.%m %H:%M', time.localtime(stale_since))}"
+        )
+    return snapshot
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        await answer_message(update, context)
+    finally:
+        # Графики и тексты уходят через очередь чата - ждём, пока всё отправится
+        await delivery.flush(update.message)
+
+async def answer_message(update, context):
     text = update.message.text.lower()
     
     # Проверяем переменные окружения
-    if not TELEGRAM_TOKEN or not SHEET_ID or not OPENAI_API_KEY:
-        await update.message.reply_text("Ошибка: не настроены переменные окружения (TELEGRAM_TOKEN, SHEET_ID, OPENAI_API_KEY)")
+    if not TELEGRAM_TOKEN or not SURVEYS or not OPENAI_API_KEY:
+        delivery.reply_text(update.message, "Ошибка: не настроены переменные окружения (TELEGRAM_TOKEN, SHEET_ID или SURVEYS, OPENAI_API_KEY)")
         return
     
-    df = get_df_from_gsheet()
+    # Тяжёлые отчёты - в фоновую очередь, обработчик сразу освобождается
+    if text in REPORT_JOBS:
+        title, build = REPORT_JOBS[text]
+        await submit_report(update, context, title, build)
+        return
     
-    # Проверяем, что данные получены
-    if df.empty:
-        await update.message.reply_text("Ошибка: не удалось получить данные из таблицы")
+    deadline = Deadline(REQUEST_DEADLINE)
+    snapshot = await load_snapshot(update, context, deadline)
+    if snapshot is None:
         return
+    df = snapshot.df
 
     # --- Кнопки ---
-    if text == '📊 полный отчет' or text == 'полный отчет':
-        summary = analyze_survey(df)
-        if len(summary) > 4000:
-            parts = []
-            current_part = ""
-            lines = summary.split('\n')
-            for line in lines:
-                if len(current_part + line + '\n') > 4000:
-                    parts.append(current_part)
-                    current_part = line + '\n'
-                else:
-                    current_part += line + '\n'
-            if current_part:
-                parts.append(current_part)
-            for i, part in enumerate(parts, 1):
-                if len(parts) > 1:
-                    header = f"📊 ПОЛНЫЙ ОТЧЕТ (часть {i}/{len(parts)})\n{'='*30}\n\n"
-                    await update.message.reply_text(header + part)
-                else:
-                    await update.message.reply_text(part)
-        else:
-            await update.message.reply_text(summary)
-        return
-    elif text == '🎯 быстрый анализ' or text == 'быстрый анализ':
+    if text == '🎯 быстрый анализ' or text == 'быстрый анализ':
         quick_analysis = generate_quick_analysis(df)
-        await update.message.reply_text(quick_analysis, parse_mode='Markdown')
+        delivery.reply_text(update.message, quick_analysis, parse_mode='Markdown')
         return
     elif text == '👥 гендерный состав' or text == 'гендерный состав':
         col = COLUMN_SYNONYMS['пол']
-        freq = df[col].value_counts()
+        freq = answer_counts(df[col])
         if len(freq) > 0:
             buf = plot_pie(df, col, 'Гендерный состав')
             if buf:
-                await update.message.reply_photo(buf)
+                delivery.reply_photos(update.message, [buf])
                 total = freq.sum()
                 male_count = freq.get('Мужской', 0)
                 female_count = freq.get('Женский', 0)
@@ -362,11 +619,11 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     stats_text += f"🏆 Больше женщин на {female_count - male_count} человек"
                 else:
                     stats_text += f"⚖️ Равное количество мужчин и женщин"
-                await update.message.reply_text(stats_text, parse_mode='Markdown')
+                delivery.reply_text(update.message, stats_text, parse_mode='Markdown')
             else:
-                await update.message.reply_text("Не удалось создать график - нет данных")
+                delivery.reply_text(update.message, "Не удалось создать график - нет данных")
         else:
-            await update.message.reply_text("Нет данных о поле респондентов")
+            delivery.reply_text(update.message, "Нет данных о поле респондентов")
         return
     elif text == '📈 возрастная статистика' or text == 'возрастная статистика':
         col = COLUMN_SYNONYMS['возраст']
@@ -375,7 +632,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if len(numeric_data) > 0:
             buf = plot_hist(df, col, 'Распределение по возрасту')
             if buf:
-                await update.message.reply_photo(buf)
+                delivery.reply_photos(update.message, [buf])
                 
                 # Добавляем текстовую статистику
                 stats_text = f"📊 *РАСПРЕДЕЛЕНИЕ ПО ВОЗРАСТУ*\n\n"
@@ -392,112 +649,97 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 for i, (age, count) in enumerate(age_counts.items(), 1):
                     stats_text += f"{i}. {age} лет: {count} человек\n"
                 
-                await update.message.reply_text(stats_text, parse_mode='Markdown')
+                delivery.reply_text(update.message, stats_text, parse_mode='Markdown')
             else:
-                await update.message.reply_text("Не удалось создать график - нет данных")
+                delivery.reply_text(update.message, "Не удалось создать график - нет данных")
         else:
-            await update.message.reply_text("Нет числовых данных о возрасте")
+            delivery.reply_text(update.message, "Нет числовых данных о возрасте")
         return
         
     elif text == '🏦 топ банков' or text == 'топ банков':
         col = COLUMN_SYNONYMS['банк']
-        freq = df[col].value_counts()
+        freq = answer_counts(df[col])
         if len(freq) > 0:
             buf = plot_bar(df, col, 'Топ банков')
             if buf:
-                await update.message.reply_photo(buf)
+                delivery.reply_photos(update.message, [buf])
                 # Аналитика по банкам
-                analysis = smart_analytics_gpt('Дай краткий анализ по топу банков', df)
-                await update.message.reply_text(analysis)
+                analysis = await gpt_commentary('Дай краткий анализ по топу банков', df, deadline)
+                delivery.reply_text(update.message, analysis)
             else:
-                await update.message.reply_text("Не удалось создать график - нет данных")
+                delivery.reply_text(update.message, "Не удалось создать график - нет данных")
         else:
-            await update.message.reply_text("Нет данных о банках")
+            delivery.reply_text(update.message, "Нет данных о банках")
         return
         
     elif text == '💼 цели посещения' or text == 'цели посещения':
         col = COLUMN_SYNONYMS['тип обращения']
-        freq = df[col].value_counts()
+        freq = answer_counts(df[col])
         if len(freq) > 0:
             buf = plot_bar(df, col, 'Цели посещения банка')
             if buf:
-                await update.message.reply_photo(buf)
+                delivery.reply_photos(update.message, [buf])
                 # Аналитика по целям
-                analysis = smart_analytics_gpt('Дай краткий анализ по целям посещения банка', df)
-                await update.message.reply_text(analysis)
+                analysis = await gpt_commentary('Дай краткий анализ по целям посещения банка', df, deadline)
+                delivery.reply_text(update.message, analysis)
             else:
-                await update.message.reply_text("Не удалось создать график - нет данных")
+                delivery.reply_text(update.message, "Не удалось создать график - нет данных")
         else:
-            await update.message.reply_text("Нет данных о целях посещения")
+            delivery.reply_text(update.message, "Нет данных о целях посещения")
         return
         
     elif text == '⭐ оценки качества' or text == 'оценки качества':
-        quality_analysis = analyze_quality_metrics(df)
-        await update.message.reply_text(quality_analysis, parse_mode='Markdown')
+        stats = snapshot.derived('quality_stats', compute_survey_quality_stats)
+        quality_analysis = analyze_quality_metrics(df, stats)
+        delivery.reply_text(update.message, quality_analysis, parse_mode='Markdown')
         return
         
     elif text == '⏰ время ожидания' or text == 'время ожидания':
         col = COLUMN_SYNONYMS['очередь']
-        freq = df[col].value_counts()
+        freq = answer_counts(df[col])
         if len(freq) > 0:
             buf = plot_bar(df, col, 'Время ожидания в очереди')
             if buf:
-                await update.message.reply_photo(buf)
-                analysis = smart_analytics_gpt('Дай краткий анализ по времени ожидания в очереди', df)
-                await update.message.reply_text(analysis)
+                delivery.reply_photos(update.message, [buf])
+                analysis = await gpt_commentary('Дай краткий анализ по времени ожидания в очереди', df, deadline)
+                delivery.reply_text(update.message, analysis)
             else:
-                await update.message.reply_text("Не удалось создать график - нет данных")
+                delivery.reply_text(update.message, "Не удалось создать график - нет данных")
         else:
-            await update.message.reply_text("Нет данных о времени ожидания")
+            delivery.reply_text(update.message, "Нет данных о времени ожидания")
+        return
+        
+    elif text == '🧭 дашборд' or text == 'дашборд':
+        # Картинка строится один раз на версию данных и хранится в снимке; рисуется не в event loop
+        dashboard = snapshot.peek('dashboard')
+        if dashboard is None:
+            rendered = await asyncio.to_thread(build_dashboard, snapshot, dashboard_data(snapshot))
+            dashboard = snapshot.derived('dashboard', lambda df: rendered)
+        image, caption = dashboard
+        buf = io.BytesIO(image)
+        buf.name = 'dashboard.png'
+        delivery.reply_photos(update.message, [buf], caption=caption)
         return
         
     elif text == '🔍 детальный анализ' or text == 'детальный анализ':
         detailed_analysis = generate_detailed_analysis(df)
-        await update.message.reply_text(detailed_analysis, parse_mode='Markdown')
+        delivery.reply_text(update.message, detailed_analysis, parse_mode='Markdown')
         return
         
     elif text == '📋 все вопросы' or text == 'все вопросы':
         questions_list = generate_questions_list(df)
-        await update.message.reply_text(questions_list, parse_mode='Markdown')
+        delivery.reply_text(update.message, questions_list, parse_mode='Markdown')
         return
 
     # Старые кнопки для совместимости
-    if text == 'отчет по опросу':
-        summary = analyze_survey(df)
-        
-        # Разбиваем длинный отчет на части
-        if len(summary) > 4000:
-            parts = []
-            current_part = ""
-            lines = summary.split('\n')
-            
-            for line in lines:
-                if len(current_part + line + '\n') > 4000:
-                    parts.append(current_part)
-                    current_part = line + '\n'
-                else:
-                    current_part += line + '\n'
-            
-            if current_part:
-                parts.append(current_part)
-            
-            for i, part in enumerate(parts, 1):
-                if len(parts) > 1:
-                    header = f"📊 ОТЧЕТ ПО ОПРОСУ (часть {i}/{len(parts)})\n{'='*30}\n\n"
-                    await update.message.reply_text(header + part)
-                else:
-                    await update.message.reply_text(part)
-        else:
-            await update.message.reply_text(summary)
-        return
-    elif text == 'гендерный pie chart':
+    if text == 'гендерный pie chart':
         col = COLUMN_SYNONYMS['пол']
-        freq = df[col].value_counts()
+        freq = answer_counts(df[col])
         
         if len(freq) > 0:
             buf = plot_pie(df, col, 'Гендерный состав')
             if buf:
-                await update.message.reply_photo(buf)
+                delivery.reply_photos(update.message, [buf])
                 
                 # Добавляем текстовую статистику
                 total = freq.sum()
@@ -517,11 +759,11 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 else:
                     stats_text += f"⚖️ Равное количество мужчин и женщин"
                 
-                await update.message.reply_text(stats_text)
+                delivery.reply_text(update.message, stats_text)
             else:
-                await update.message.reply_text("Не удалось создать график - нет данных")
+                delivery.reply_text(update.message, "Не удалось создать график - нет данных")
         else:
-            await update.message.reply_text("Нет данных о поле респондентов")
+            delivery.reply_text(update.message, "Нет данных о поле респондентов")
         return
     elif text == 'возраст: histogram':
         col = COLUMN_SYNONYMS['возраст']
@@ -530,7 +772,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if len(numeric_data) > 0:
             buf = plot_hist(df, col, 'Распределение по возрасту')
             if buf:
-                await update.message.reply_photo(buf)
+                delivery.reply_photos(update.message, [buf])
                 
                 # Добавляем текстовую статистику
                 stats_text = f"📊 РАСПРЕДЕЛЕНИЕ ПО ВОЗРАСТУ\n\n"
@@ -547,39 +789,336 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 for i, (age, count) in enumerate(age_counts.items(), 1):
                     stats_text += f"{i}. {age} лет: {count} человек\n"
                 
-                await update.message.reply_text(stats_text)
+                delivery.reply_text(update.message, stats_text)
             else:
-                await update.message.reply_text("Не удалось создать график - нет данных")
+                delivery.reply_text(update.message, "Не удалось создать график - нет данных")
         else:
-            await update.message.reply_text("Нет числовых данных о возрасте")
+            delivery.reply_text(update.message, "Нет числовых данных о возрасте")
         return
     elif text == 'тип обращения: bar chart':
         col = COLUMN_SYNONYMS['тип обращения']
         buf = plot_bar(df, col, 'Типы обращений')
         if buf:
-            await update.message.reply_photo(buf)
-            analysis = smart_analytics_gpt('Дай краткий анализ по типам обращений', df)
-            await update.message.reply_text(analysis)
+            delivery.reply_photos(update.message, [buf])
+            analysis = await gpt_commentary('Дай краткий анализ по типам обращений', df, deadline)
+            delivery.reply_text(update.message, analysis)
         else:
-            await update.message.reply_text("Не удалось создать график - нет данных")
+            delivery.reply_text(update.message, "Не удалось создать график - нет данных")
         return
     elif text == 'топ банков: bar chart':
         col = COLUMN_SYNONYMS['банк']
         buf = plot_bar(df, col, 'Топ посещаемых банков')
         if buf:
-            await update.message.reply_photo(buf)
-            analysis = smart_analytics_gpt('Дай краткий анализ по топу банков', df)
-            await update.message.reply_text(analysis)
+            delivery.reply_photos(update.message, [buf])
+            analysis = await gpt_commentary('Дай краткий анализ по топу банков', df, deadline)
+            delivery.reply_text(update.message, analysis)
         else:
-            await update.message.reply_text("Не удалось создать график - нет данных")
+            delivery.reply_text(update.message, "Не удалось создать график - нет данных")
+        return
+
+    # --- Динамика метрик по времени ---
+    trend = parse_trend_query(text)
+    if trend:
+        metric, days = trend
+        index = snapshot.derived('trends', lambda df: TrendIndex(TREND_METRICS).refresh(df))
+        buf, trend_text = generate_trend(index, metric, days)
+        if buf:
+            delivery.reply_photos(update.message, [buf])
+        delivery.reply_text(update.message, trend_text, parse_mode='Markdown')
         return
 
     # --- Любой другой текстовый запрос ---
+    reply = await gpt_commentary(update.message.text, df, deadline)
+    delivery.reply_text(update.message, reply)
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/profile [N | Ts | stop] [топ] - профиль следующих N сообщений или T секунд (только для админов)"""
+    if update.effective_user is None or update.effective_user.id not in ADMIN_IDS:
+        delivery.reply_text(update.message, "Команда доступна только администраторам")
+        return
+    args = [a.lower() for a in context.args]
+    if args and args[0] == 'stop':
+        if not profiler.active:
+            delivery.reply_text(update.message, "Профилирование не запущено")
+        profiler.stop()
+        return
+    calls, seconds = 20, None
+    if args and args[0].endswith('s') and args[0][:-1].isdigit():
+        calls, seconds = None, int(args[0][:-1])
+    elif args and args[0].isdigit():
+        calls = int(args[0])
+    top = int(args[1]) if len(args) > 1 and args[1].isdigit() else None
+    message = update.message
+
+    async def send_summary(summary):
+        for part in split_message(summary):
+            delivery.reply_text(message, part)
+        await delivery.flush(message)
+
     try:
-        reply = smart_analytics_gpt(update.message.text, df)
-        await update.message.reply_text(reply)
-    except Exception as e:
-        await update.message.reply_text("Не смог получить умный ответ. Попробуйте иначе!\nОшибка: " + str(e))
+        profiler.start(send_summary, calls=calls, seconds=seconds, top=top)
+    except RuntimeError as e:
+        delivery.reply_text(update.message, f"Не удалось начать профилирование: {e}")
+        return
+    target = f"{seconds} с" if seconds else f"{calls} сообщений"
+    delivery.reply_text(update.message, f"🔬 Профилирую {target} (не дольше {profiler.max_seconds:.0f} с). Остановить: /profile stop")
+
+def split_message(text, limit=4000):
+    """Разбивает длинный текст по строкам на части не длиннее limit"""
+    if len(text) <= limit:
+        return [text]
+    parts = []
+    current_part = ""
+    for line in text.split('\n'):
+        if len(current_part + line + '\n') > limit:
+            parts.append(current_part)
+            current_part = line + '\n'
+        else:
+            current_part += line + '\n'
+    if current_part:
+        parts.append(current_part)
+    return parts
+
+async def submit_report(update, context, title, build):
+    """Ставит отчёт в очередь; сообщение о постановке потом обновляется ходом работы"""
+    chat_id = update.effective_chat.id
+    status = None
+
+    async def notify(job, text):
+        # Задача могла начаться раньше, чем ушло сообщение о постановке в очередь (или его не удалось отправить)
+        if status is not None and status.done() and not status.cancelled() and status.exception() is None:
+            delivery.edit_text(status.result(), text)
+
+    async def run(job):
+        await build(job, update, context)
+
+    try:
+        job = report_queue.submit(chat_id, title, run, notify)
+    except JobLimitError as e:
+        delivery.reply_text(update.message, f"⏳ Не могу принять отчет: {e}. Отменить текущие: /cancel")
+        return
+    position = report_queue.position(job)
+    queued = f"в очереди: {position}" if position > 0 else "принят в работу"
+    status = delivery.reply_text(update.message, f"⏳ {title} ({queued}). Отменить: /cancel {job.id}")
+
+async def cancel_reports(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/cancel - отменить все отчеты чата, /cancel <номер> - один"""
+    job_id = None
+    if context.args:
+        # Без номера отменяются все отчеты чата - поэтому непонятный номер не должен значить «все»
+        if len(context.args) > 1 or not context.args[0].isdigit():
+            delivery.reply_text(update.message, "Использование: /cancel - отменить все отчеты, /cancel <номер> - один")
+            return
+        job_id = int(context.args[0])
+    cancelled = report_queue.cancel(update.effective_chat.id, job_id)
+    if cancelled:
+        delivery.reply_text(update.message, "⏹ Отменено: " + ", ".join(f"{job.title} (№{job.id})" for job in cancelled))
+    else:
+        delivery.reply_text(update.message, "Нет отчетов в работе")
+
+async def full_report_job(job, update, context, header):
+    """Полный отчет по всем вопросам, длинный текст отправляется частями"""
+    await job.progress(f"⏳ {job.title}: загружаю данные")
+    snapshot = await load_snapshot(update, context, Deadline(REQUEST_DEADLINE))
+    if snapshot is None:
+        raise JobFailed("нет данных опроса")
+    await job.progress(f"⏳ {job.title}: считаю статистику")
+    summary = await job.run_sync(analyze_survey, snapshot.df)
+    parts = split_message(summary)
+    await job.progress(f"⏳ {job.title}: отправляю")
+    for i, part in enumerate(parts, 1):
+        if len(parts) > 1:
+            delivery.reply_text(update.message, f"{header} (часть {i}/{len(parts)})\n{'='*30}\n\n" + part)
+        else:
+            delivery.reply_text(update.message, part)
+    await delivery.flush(update.message)
+
+async def charts_report_job(job, update, context):
+    """Основные графики опроса и общий AI-комментарий"""
+    await job.progress(f"⏳ {job.title}: загружаю данные")
+    snapshot = await load_snapshot(update, context, Deadline(REQUEST_DEADLINE))
+    if snapshot is None:
+        raise JobFailed("нет данных опроса")
+    df = snapshot.df
+    charts = [
+        (plot_pie, 'пол', 'Гендерный состав'),
+        (plot_hist, 'возраст', 'Распределение по возрасту'),
+        (plot_bar, 'банк', 'Топ посещаемых банков'),
+        (plot_bar, 'очередь', 'Время ожидания в очереди'),
+    ]
+    buffers = []
+    for i, (plot, key, title) in enumerate(charts, 1):
+        await job.progress(f"⏳ {job.title}: график {i}/{len(charts)}")
+        col = COLUMN_SYNONYMS[key]
+        buffers.append(await job.run_sync(plot, df, col, title) if col in df.columns else None)
+    # Все графики - одним альбомом; пока он загружается, готовится комментарий
+    delivery.reply_photos(update.message, buffers)
+    await job.progress(f"⏳ {job.title}: готовлю AI-комментарий")
+    analysis = await gpt_commentary(
+        'Дай краткий общий анализ опроса: пол, возраст, банки и время ожидания', df, Deadline(REQUEST_DEADLINE)
+    )
+    delivery.reply_text(update.message, analysis)
+    await delivery.flush(update.message)
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/export [xlsx | csv | parquet] - частоты, оценки качества и разрезы по сегментам одним файлом"""
+    fmt = context.args[0].lower() if context.args else EXPORT_FORMAT
+    try:
+        exporter.check(fmt)
+    except ExportError as e:
+        delivery.reply_text(update.message, f"Не могу сделать выгрузку: {e}")
+        return
+    await submit_report(update, context, f'Выгрузка {fmt.upper()}', partial(export_job, fmt=fmt))
+
+async def export_job(job, update, context, fmt):
+    """Файл строится в процессе-воркере, сюда возвращается только путь к нему"""
+    await job.progress(f"⏳ {job.title}: загружаю данные")
+    snapshot = await load_snapshot(update, context, Deadline(REQUEST_DEADLINE))
+    if snapshot is None:
+        raise JobFailed("нет данных опроса")
+    await job.progress(f"⏳ {job.title}: записываю файл ({len(snapshot.df)} анкет)")
+    path, counts = await exporter.export(
+        snapshot.df, fmt,
+        metrics={key: (COLUMN_SYNONYMS[key], POSITIVE_ANSWERS[key]) for key in QUALITY_METRICS + ['рекомендация']},
+        labels=QUALITY_LABELS,
+        dimensions={key.capitalize(): COLUMN_SYNONYMS[key] for key in QUALITY_SEGMENTS},
+        n_resamples=BOOTSTRAP_RESAMPLES,
+        min_effect=QUALITY_MIN_EFFECT,
+    )
+    sent = None
+    try:
+        size = os.path.getsize(path)
+        if size > TELEGRAM_FILE_LIMIT:
+            delivery.reply_text(update.message, f"❌ Файл получился {size / 2**20:.0f} МБ - больше лимита Telegram "
+                                                f"(50 МБ). Попробуйте /export parquet")
+            raise JobFailed("файл больше лимита Telegram")
+        await job.progress(f"⏳ {job.title}: отправляю {size / 2**20:.1f} МБ")
+        filename = f"{snapshot.survey.name}-{time.strftime('%Y%m%d-%H%M')}{exporter.suffix(fmt)}"
+        caption = f"📤 Выгрузка опроса «{snapshot.survey.name}»: {len(snapshot.df)} анкет\n" + "\n".join(
+            f"• {name}: {rows} строк" for name, rows in counts.items())
+        document = open(path, 'rb')
+        sent = delivery.reply_document(update.message, document, filename=filename, caption=caption)
+        # Файл нужен, пока отправка не закончилась - даже если отчёт за это время отменили
+        sent.add_done_callback(lambda _: discard_file(document, path))
+        await asyncio.shield(sent)
+    finally:
+        if sent is None:
+            os.remove(path)
+
+def discard_file(document, path):
+    document.close()
+    os.remove(path)
+
+# Отчёты, которые строятся в фоновой очереди: текст кнопки -> (название, функция)
+REPORT_JOBS = {
+    '📊 полный отчет': ('Полный отчет', partial(full_report_job, header="📊 ПОЛНЫЙ ОТЧЕТ")),
+    'полный отчет': ('Полный отчет', partial(full_report_job, header="📊 ПОЛНЫЙ ОТЧЕТ")),
+    'отчет по опросу': ('Отчет по опросу', partial(full_report_job, header="📊 ОТЧЕТ ПО ОПРОСУ")),
+    '🖼 отчет с графиками': ('Отчет с графиками', charts_report_job),
+    'отчет с графиками': ('Отчет с графиками', charts_report_job),
+}
+
+def scale_counts(df, key):
+    """Частоты ответов в порядке шкалы (без неотвеченных вариантов)"""
+    col = COLUMN_SYNONYMS[key]
+    if col not in df.columns:
+        return pd.Series(dtype=int)
+    freq = df[col].value_counts(sort=False)
+    return freq[freq > 0]
+
+def numeric_answers(df, key):
+    col = COLUMN_SYNONYMS[key]
+    return extract_numeric(df[col]).dropna() if col in df.columns else pd.Series(dtype=float)
+
+def dashboard_data(snapshot):
+    """Агрегаты для дашборда; каждый считается один раз на снимок и доступен другим отчётам"""
+    return {
+        'stats': snapshot.derived('quality_stats', compute_survey_quality_stats),
+        'gender': snapshot.derived('counts:пол', lambda df: scale_counts(df, 'пол')),
+        'banks': snapshot.derived('counts:банк', lambda df: scale_counts(df, 'банк').sort_values(ascending=False)),
+        'waiting': snapshot.derived('counts:очередь', lambda df: scale_counts(df, 'очередь')),
+        'ages': snapshot.derived('numeric:возраст', lambda df: numeric_answers(df, 'возраст')),
+        'age_counts': snapshot.derived('counts:возраст', lambda df: numeric_answers(df, 'возраст').value_counts()),
+    }
+
+def build_dashboard(snapshot, data):
+    """Дашборд из агрегатов снимка: (байты картинки, подпись); выполняется в потоке"""
+    df = snapshot.df
+    stats = data['stats']
+    gender = data['gender']
+    all_banks = data['banks']
+    banks = all_banks.head(8)
+    # Шкала ожидания хранится от худшего к лучшему - показываем от быстрого к долгому
+    waiting = data['waiting'][::-1]
+    ages = data['ages']
+
+    scorecard = []
+    for key in QUALITY_LABELS:
+        if key in stats.metrics:
+            rate, low, high, total = stats.overall(key)
+            if total:
+                scorecard.append((DASHBOARD_LABELS[key], rate, low, high))
+
+    summary = [f"Анкет: {len(df)}"]
+    if len(ages):
+        summary.append(f"Средний возраст: {ages.mean():.1f} лет")
+    if len(banks):
+        summary.append(f"Топ банк: {banks.index[0]} ({banks.iloc[0] / all_banks.sum() * 100:.0f}%)")
+    quality = [stats.overall(key)[0] for key in QUALITY_METRICS if key in stats.metrics and stats.overall(key)[3]]
+    if quality:
+        summary.append(f"Рейтинг качества: {sum(quality) / len(quality) * 100:.1f}%")
+    if 'рекомендация' in stats.metrics and stats.overall('рекомендация')[3]:
+        summary.append(f"Готовы рекомендовать: {stats.overall('рекомендация')[0] * 100:.1f}%")
+    if TIMESTAMP_COLUMN in df.columns and df[TIMESTAMP_COLUMN].notna().any():
+        summary.append(f"Последняя анкета: {df[TIMESTAMP_COLUMN].max():%d.%m.%Y %H:%M}")
+    summary.append("Качество: пунктир - пороги 60/80%,")
+    summary.append("усы - 95% доверительный интервал")
+
+    buf = chart_renderer.dashboard(
+        f'Дашборд опроса: {snapshot.survey.name}', gender, data['age_counts'], banks, waiting, scorecard, summary,
+    )
+    return buf.getvalue(), f"🧭 Дашборд опроса «{snapshot.survey.name}»: {len(df)} анкет"
+
+def parse_trend_query(text):
+    """'динамика рекомендаций за месяц' -> ('рекомендация', 30); None, если это не запрос динамики"""
+    if 'динамик' not in text and 'тренд' not in text:
+        return None
+    metric = next((m for word, m in TREND_KEYWORDS if word in text), 'удовлетворенность')
+    days = next((d for word, d in TREND_PERIODS if word in text), None)
+    return metric, days
+
+def generate_trend(index, metric, days):
+    """График и текст по индексу динамики: по дням за период до месяца, иначе по неделям"""
+    freq = 'D' if days is not None and days <= 31 else 'W'
+    values, counts = index.series(metric, days=days, freq=freq)
+    title = TREND_TITLES[metric]
+    if values.empty:
+        return None, f"❌ Нет данных с отметкой времени для динамики: {title}"
+    is_rate = metric != 'ожидание'
+    if is_rate:
+        values = values * 100
+    unit = '%' if is_rate else ' мин'
+    # Окно считается до дня последней анкеты - показываем, до какого именно
+    last_day = index.sums.index.max()
+    period = (f"за {days} дн. до последней анкеты ({last_day:%d.%m.%Y})" if days
+              else f"за всё время (по {last_day:%d.%m.%Y})")
+    step = 'по дням' if freq == 'D' else 'по неделям'
+    buf = chart_renderer.line(values, f'{title} ({step})', '% положительных' if is_rate else 'минут',
+                              percent=is_rate)
+
+    text = f"📉 *ДИНАМИКА: {title.upper()}*\n\n"
+    text += f"• Период: {period}, {step}\n"
+    text += f"• Ответов: {int(counts.sum())}\n"
+    text += f"• Начало периода: {values.iloc[0]:.1f}{unit}\n"
+    text += f"• Конец периода: {values.iloc[-1]:.1f}{unit}\n"
+    best, worst = (values.max(), values.min()) if is_rate else (values.min(), values.max())
+    text += f"• Лучшее значение: {best:.1f}{unit}, худшее: {worst:.1f}{unit}\n"
+    if len(values) > 1:
+        change = values.iloc[-1] - values.iloc[0]
+        better = change > 0 if is_rate else change < 0
+        emoji = "⚖️" if abs(change) < 0.05 else ("📈" if better else "📉")
+        text += f"\n{emoji} Изменение: {change:+.1f}{' п.п.' if is_rate else unit}"
+    return buf, text
 
 def analyze_survey(df):
     summary = f"📊 ОТЧЕТ ПО ОПРОСУ БАНКОВСКИХ КЛИЕНТОВ\n"
@@ -594,7 +1133,7 @@ def analyze_survey(df):
     summary += f"🔍 Основные результаты:\n\n"
     
     for i, col in enumerate(relevant_columns, 1):
-        val = df[col].value_counts()
+        val = answer_counts(df[col])
         if val.shape[0] > 1:
             total = val.sum()
             top_answer = val.idxmax()
@@ -638,7 +1177,7 @@ def generate_quick_analysis(df):
     # Анализ банков
     bank_col = COLUMN_SYNONYMS.get('банк')
     if bank_col and bank_col in df.columns:
-        bank_freq = df[bank_col].value_counts()
+        bank_freq = answer_counts(df[bank_col])
         if len(bank_freq) > 0:
             top_bank = bank_freq.idxmax()
             top_count = bank_freq.max()
@@ -665,7 +1204,7 @@ def generate_quick_analysis(df):
     for key, name in quality_cols.items():
         col = COLUMN_SYNONYMS.get(key)
         if col and col in df.columns:
-            freq = df[col].value_counts()
+            freq = answer_counts(df[col])
             if len(freq) > 0:
                 positive_answers = freq.get('Очень вежливы', 0) + freq.get('Вежливы', 0) + freq.get('Высокая', 0) + freq.get('Очень высокая', 0) + freq.get('Очень понятно', 0) + freq.get('Понятно', 0) + freq.get('Отлично', 0) + freq.get('Хорошо', 0)
                 total = freq.sum()
@@ -675,7 +1214,7 @@ def generate_quick_analysis(df):
     # Анализ проблем
     problem_col = COLUMN_SYNONYMS.get('проблем')
     if problem_col and problem_col in df.columns:
-        problem_freq = df[problem_col].value_counts()
+        problem_freq = answer_counts(df[problem_col])
         if len(problem_freq) > 0:
             no_problems = problem_freq.get('Нет, все вопросы решены', 0)
             total_problems = problem_freq.sum()
@@ -685,7 +1224,7 @@ def generate_quick_analysis(df):
     # Рекомендации
     rec_col = COLUMN_SYNONYMS.get('рекомендация')
     if rec_col and rec_col in df.columns:
-        rec_freq = df[rec_col].value_counts()
+        rec_freq = answer_counts(df[rec_col])
         if len(rec_freq) > 0:
             positive_rec = rec_freq.get('Определенно да', 0) + rec_freq.get('Скорее да', 0)
             total_rec = rec_freq.sum()
@@ -699,55 +1238,52 @@ def generate_quick_analysis(df):
     
     return analysis
 
-def analyze_quality_metrics(df):
-    """Анализ всех метрик качества обслуживания"""
+def compute_survey_quality_stats(df):
+    """Доли положительных ответов с бутстрап-интервалами по всем метрикам, банкам и полу"""
+    return compute_quality_stats(
+        df,
+        {key: (COLUMN_SYNONYMS[key], POSITIVE_ANSWERS[key]) for key in QUALITY_METRICS + ['рекомендация']},
+        {key: COLUMN_SYNONYMS[key] for key in QUALITY_SEGMENTS},
+        n_resamples=BOOTSTRAP_RESAMPLES,
+    )
+
+def analyze_quality_metrics(df, stats=None):
+    """Анализ всех метрик качества обслуживания с 95% доверительными интервалами"""
+    if stats is None:
+        stats = compute_survey_quality_stats(df)
     analysis = f"⭐ *АНАЛИЗ КАЧЕСТВА ОБСЛУЖИВАНИЯ*\n\n"
     
-    quality_metrics = {
-        'вежливость': 'Вежливость сотрудников',
-        'компетентность': 'Компетентность сотрудников', 
-        'понятно': 'Понятность объяснений',
-        'чистота': 'Чистота и комфорт',
-        'доступность': 'Доступность информации',
-        'терминал': 'Удобство терминалов'
-    }
-    
     total_scores = {}
+    uncertain = False
     
-    for key, name in quality_metrics.items():
-        col = COLUMN_SYNONYMS.get(key)
-        if col and col in df.columns:
-            freq = df[col].value_counts()
-            if len(freq) > 0:
-                total = freq.sum()
-                
-                # Определяем положительные ответы для каждого метрика
-                positive_answers = 0
-                if key == 'вежливость':
-                    positive_answers = freq.get('Очень вежливы', 0) + freq.get('Вежливы', 0)
-                elif key == 'компетентность':
-                    positive_answers = freq.get('Высокая', 0) + freq.get('Очень высокая', 0)
-                elif key == 'понятно':
-                    positive_answers = freq.get('Очень понятно', 0) + freq.get('Понятно', 0)
-                elif key == 'чистота':
-                    positive_answers = freq.get('Отлично', 0) + freq.get('Хорошо', 0)
-                elif key == 'доступность':
-                    positive_answers = freq.get('Очень доступна', 0) + freq.get('Доступна', 0)
-                elif key == 'терминал':
-                    positive_answers = freq.get('Очень удобно', 0) + freq.get('Удобно', 0)
-                
-                positive_percent = (positive_answers / total) * 100 if total > 0 else 0
-                total_scores[key] = positive_percent
-                
-                # Эмодзи для оценки
-                if positive_percent >= 80:
-                    emoji = "🟢"
-                elif positive_percent >= 60:
-                    emoji = "🟡"
-                else:
-                    emoji = "🔴"
-                
-                analysis += f"{emoji} *{name}:* {positive_percent:.1f}% положительных оценок\n"
+    for key, name in QUALITY_LABELS.items():
+        if key not in stats.metrics:
+            continue
+        rate, low, high, total = stats.overall(key)
+        if total == 0:
+            continue
+        positive_percent, low, high = rate * 100, low * 100, high * 100
+        if key in QUALITY_METRICS:
+            total_scores[key] = positive_percent
+        
+        # Эмодзи для оценки
+        if positive_percent >= 80:
+            emoji = "🟢"
+        elif positive_percent >= 60:
+            emoji = "🟡"
+        else:
+            emoji = "🔴"
+        
+        # Интервал захватывает порог 60% или 80% - цвет может быть случайным
+        crosses = any(low < threshold <= high for threshold in (60, 80))
+        uncertain = uncertain or crosses
+        analysis += (
+            f"{emoji} *{name}:* {positive_percent:.1f}% положительных оценок "
+            f"(ДИ {low:.0f}-{high:.0f}%, n={total}){' ❔' if crosses else ''}\n"
+        )
+    
+    if uncertain:
+        analysis += f"\n❔ - интервал пересекает порог 60% или 80%, цвет оценки статистически не значим\n"
     
     # Общий рейтинг
     if total_scores:
@@ -761,6 +1297,23 @@ def analyze_quality_metrics(df):
         else:
             analysis += f"❌ *Требуется серьезная работа над качеством*\n"
     
+    # Отличия сегментов от остальных респондентов
+    for dimension, title in QUALITY_SEGMENTS.items():
+        lines = []
+        for key, name in QUALITY_LABELS.items():
+            if key not in stats.metrics:
+                continue
+            for value, rate, direction in stats.differences(key, dimension, QUALITY_MIN_EFFECT):
+                # Сегменты (банки) - свободный текст: _ или * в названии сломали бы разметку всего ответа
+                lines.append(f"• {name}: {escape_markdown(str(value))} {'выше' if direction > 0 else 'ниже'} остальных ({rate * 100:.0f}%)\n")
+        analysis += f"\n{title}\n"
+        if lines:
+            analysis += ''.join(lines)
+            analysis += f"Остальные различия статистически не значимы\n"
+        else:
+            analysis += f"• Значимых различий нет - разница в процентах объясняется случайностью\n"
+    
+    analysis += f"\n_ДИ - {stats.confidence * 100:.0f}% доверительный интервал (бутстрап)_\n"
     return analysis
 
 def generate_detailed_analysis(df):
@@ -772,7 +1325,7 @@ def generate_detailed_analysis(df):
     
     gender_col = COLUMN_SYNONYMS.get('пол')
     if gender_col and gender_col in df.columns:
-        gender_freq = df[gender_col].value_counts()
+        gender_freq = answer_counts(df[gender_col])
         if len(gender_freq) > 0:
             male = gender_freq.get('Мужской', 0)
             female = gender_freq.get('Женский', 0)
@@ -784,7 +1337,7 @@ def generate_detailed_analysis(df):
     analysis += f"🏦 *АНАЛИЗ БАНКОВ:*\n"
     bank_col = COLUMN_SYNONYMS.get('банк')
     if bank_col and bank_col in df.columns:
-        bank_freq = df[bank_col].value_counts()
+        bank_freq = answer_counts(df[bank_col])
         if len(bank_freq) > 0:
             for i, (bank, count) in enumerate(bank_freq.head(3).items(), 1):
                 percent = (count / bank_freq.sum()) * 100
@@ -795,7 +1348,7 @@ def generate_detailed_analysis(df):
     analysis += f"⚠️ *АНАЛИЗ ПРОБЛЕМ:*\n"
     problem_col = COLUMN_SYNONYMS.get('проблем')
     if problem_col and problem_col in df.columns:
-        problem_freq = df[problem_col].value_counts()
+        problem_freq = answer_counts(df[problem_col])
         if len(problem_freq) > 0:
             for problem, count in problem_freq.items():
                 percent = (count / problem_freq.sum()) * 100
@@ -826,7 +1379,7 @@ def generate_questions_list(df):
     relevant_columns = [col for col in df.columns if 'отметка времени' not in col.lower() and 'timestamp' not in col.lower()]
     
     for i, col in enumerate(relevant_columns, 1):
-        val = df[col].value_counts()
+        val = answer_counts(df[col])
         total = val.sum() if len(val) > 0 else 0
         
         questions += f"{i}. *{col}*\n"
@@ -849,7 +1402,7 @@ def generate_comparison_analysis(df, column):
     """Генерирует анализ сравнений для колонки"""
     comparison = f"📊 *СРАВНИТЕЛЬНЫЙ АНАЛИЗ: {column}*\n\n"
     
-    freq = df[column].value_counts()
+    freq = answer_counts(df[column])
     if len(freq) < 2:
         return f"❌ Недостаточно данных для сравнения в колонке '{column}'"
     
@@ -893,7 +1446,7 @@ def generate_recommendations(df, column):
     """Генерирует рекомендации на основе данных колонки"""
     recommendations = f"💡 *РЕКОМЕНДАЦИИ ПО: {column}*\n\n"
     
-    freq = df[column].value_counts()
+    freq = answer_counts(df[column])
     if len(freq) == 0:
         return f"❌ Нет данных для анализа в колонке '{column}'"
     
@@ -966,10 +1519,31 @@ def generate_recommendations(df, column):
     
     return recommendations
 
-def main():
-    app = Application.builder().token(TELEGRAM_TOKEN).build()
+async def shutdown(app):
+    await report_queue.stop()
+    exporter.shutdown()
+
+def build_application(token, request=None, get_updates_request=None):
+    """Application со всеми обработчиками; request подменяется в нагрузочном тесте"""
+    builder = Application.builder().token(token).concurrent_updates(CONCURRENT_UPDATES)
+    builder = builder.post_shutdown(shutdown)
+    if request is not None:
+        builder = builder.request(request)
+    if get_updates_request is not None:
+        builder = builder.get_updates_request(get_updates_request)
+    app = builder.build()
     app.add_handler(CommandHandler("start", start))
-    app.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), handle_message))
+    app.add_handler(CommandHandler("survey", select_survey))
+    app.add_handler(CommandHandler("cancel", cancel_reports))
+    app.add_handler(CommandHandler("profile", profile_command))
+    app.add_handler(CommandHandler("export", export_command))
+    message_handler = MessageHandler(filters.TEXT & (~filters.COMMAND), handle_message)
+    profiler.attach(message_handler)
+    app.add_handler(message_handler)
+    return app
+
+def main():
+    app = build_application(TELEGRAM_TOKEN)
     app.run_polling()
 
 if __name__ == '__main__':
@@ -0,0 +1,42 @@
+"""Проверки нормализации названий банков: python -m pytest -q"""
+import pandas as pd
+
+from banks import BankNormalizer, name_key
+
+
+def test_short_name_keeps_whole_word():
+    # Без слова 'банк' от 'Т-Банк' осталась бы одна буква
+    assert name_key('Т-Банк') == 'тбанк'
+    assert name_key('т банк') == name_key('Т-Банк')
+    assert name_key('МКБ') == 'мкб'
+
+
+def test_short_name_is_not_a_wildcard():
+    normalizer = BankNormalizer()
+    assert normalizer.canonical('Т-Банк') == 'Т-Банк'
+    assert normalizer.canonical('т банк') == 'Т-Банк'
+    assert normalizer.canonical('Тинькофф') == 'Т-Банк'
+    assert normalizer.canonical('Точка') != 'Т-Банк'
+
+
+def test_prefix_needs_misspelled_bank_word():
+    normalizer = BankNormalizer()
+    assert normalizer.canonical('сбербанг') == 'Сбербанк'
+    assert normalizer.canonical('альфабнк') == 'Альфа-Банк'
+    # Другое название, начинающееся с известного, - не опечатка
+    assert normalizer.canonical('газпромнефть') == 'Газпромнефть'
+    assert normalizer.canonical('Газпром') == 'Газпромбанк'
+
+
+def test_known_name_among_words():
+    normalizer = BankNormalizer()
+    assert normalizer.canonical('Сбербанк онлайн') == 'Сбербанк'
+    assert normalizer.canonical('втб на ленина') == 'ВТБ'
+
+
+def test_normalize_keeps_missing_values():
+    normalizer = BankNormalizer()
+    series = pd.Series(['Сбер', None, 'сбербанк', 'ВТБ 24'])
+    result = normalizer.normalize(series)
+    assert list(result.iloc[[0, 2, 3]]) == ['Сбербанк', 'Сбербанк', 'ВТБ']
+    assert pd.isna(result.iloc[1])
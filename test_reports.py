@@ -0,0 +1,53 @@
+"""Отчёты по типизированному снимку совпадают с отчётами по строкам таблицы: python -m pytest -q"""
+import os
+
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+
+import pandas as pd
+import pytest
+
+import test as bot
+from fakes import FakeWorksheet, sample_records
+from schema import apply_schema, parse_timestamps
+from sheetload import read_worksheet
+
+REPORTS = [
+    bot.analyze_survey,
+    bot.generate_quick_analysis,
+    bot.generate_detailed_analysis,
+    bot.generate_questions_list,
+    bot.get_stats_for_gpt,
+]
+
+
+def survey_records(n=300):
+    records = sample_records(n)
+    waiting = bot.COLUMN_SYNONYMS['очередь']
+    for record in records:
+        # Вариант шкалы, который никто не выбрал, и вопрос с единственным ответом
+        if record[waiting] == 'Более 20 минут':
+            record[waiting] = '10-20 минут'
+        record[bot.COLUMN_SYNONYMS['пол']] = 'Женский'
+    return records
+
+
+@pytest.fixture(scope='module')
+def frames():
+    records = survey_records()
+    baseline = pd.DataFrame(records)
+    loaded = read_worksheet(FakeWorksheet(records), 100, {bot.TIMESTAMP_COLUMN: parse_timestamps})
+    typed, _ = apply_schema(loaded, hints=bot.SCHEMA_HINTS, scales=bot.ORDINAL_SCALES)
+    return baseline, typed
+
+
+@pytest.mark.parametrize('report', REPORTS, ids=lambda f: f.__name__)
+def test_typed_frame_gives_same_report(frames, report):
+    baseline, typed = frames
+    assert report(typed) == report(baseline)
+
+
+def test_unanswered_scale_values_are_dropped(frames):
+    _, typed = frames
+    counts = bot.answer_counts(typed[bot.COLUMN_SYNONYMS['очередь']])
+    assert 'Более 20 минут' not in counts.index
+    assert (counts > 0).all()
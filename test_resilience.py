@@ -0,0 +1,139 @@
+"""Таймауты, ретраи и circuit breaker на заглушках с ошибками: python -m pytest -q"""
+import asyncio
+import random
+import time
+
+import pytest
+
+from fakes import FaultInjector, InjectedFault
+from resilience import CircuitBreaker, CircuitOpenError, Deadline, Dependency
+
+
+class Clock:
+    """Ручные часы для breaker и дедлайна"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class MaxJitter(random.Random):
+    """Джиттер всегда на потолке; запоминает границы каждой задержки"""
+
+    def __init__(self):
+        super().__init__(0)
+        self.bounds = []
+
+    def uniform(self, a, b):
+        self.bounds.append((a, b))
+        return b
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_attempt_times_out_and_thread_is_released():
+    faults = FaultInjector(latency=0.3)
+    dependency = Dependency('slow', timeout=0.05, retries=0)
+    started = time.perf_counter()
+    with pytest.raises(asyncio.TimeoutError):
+        run(dependency.call(faults))
+    assert time.perf_counter() - started < 0.25
+    assert dependency._abandoned == 1
+    time.sleep(0.4)
+    assert dependency._abandoned == 0
+
+
+def test_retries_with_jitter_until_success():
+    faults = FaultInjector()
+    faults.fail_next(2)
+    rng = MaxJitter()
+    dependency = Dependency('flaky', timeout=1.0, retries=2, backoff=0.01, max_backoff=0.015, rng=rng)
+    run(dependency.call(faults))
+    assert faults.calls == 3
+    # Потолок задержки растёт экспоненциально и ограничен max_backoff
+    assert rng.bounds == [(0, 0.01), (0, 0.015)]
+    assert dependency.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_no_retry_when_delay_exceeds_deadline():
+    clock = Clock()
+    faults = FaultInjector()
+    faults.fail_next(5)
+    dependency = Dependency('flaky', timeout=1.0, retries=3, backoff=2.0, max_backoff=2.0, rng=MaxJitter())
+    with pytest.raises(InjectedFault):
+        run(dependency.call(faults, deadline=Deadline(1.0, clock=clock)))
+    assert faults.calls == 1
+
+
+def test_breaker_opens_and_rejects_without_calling():
+    clock = Clock()
+    faults = FaultInjector(error_rate=1.0)
+    breaker = CircuitBreaker('sheets', failure_threshold=2, reset_timeout=30, clock=clock)
+    dependency = Dependency('sheets', timeout=1.0, retries=1, backoff=0.0, breaker=breaker)
+    with pytest.raises(InjectedFault):
+        run(dependency.call(faults))
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        run(dependency.call(faults))
+    assert faults.calls == 2
+
+
+def test_half_open_lets_one_trial_through():
+    clock = Clock()
+    breaker = CircuitBreaker('openai', failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    clock.advance(30)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    # Неудачная проба снова размыкает breaker на reset_timeout
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.advance(30)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_cancelled_trial_releases_breaker():
+    clock = Clock()
+    breaker = CircuitBreaker('openai', failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    clock.advance(30)
+    dependency = Dependency('openai', timeout=1.0, retries=0, breaker=breaker)
+
+    async def cancel_trial():
+        task = asyncio.create_task(dependency.call(FaultInjector(latency=0.2)))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    run(cancel_trial())
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+
+
+def test_abandoned_threads_fail_fast():
+    faults = FaultInjector(latency=0.3)
+    dependency = Dependency('slow', timeout=0.05, retries=0, max_workers=1,
+                            breaker=CircuitBreaker('slow', failure_threshold=10))
+    with pytest.raises(asyncio.TimeoutError):
+        run(dependency.call(faults))
+    # Единственный поток занят зависшим вызовом - новая попытка не ждёт в очереди пула
+    started = time.perf_counter()
+    with pytest.raises(TimeoutError, match='заняты'):
+        run(dependency.call(faults))
+    assert time.perf_counter() - started < 0.05
+    assert faults.calls == 1
+    time.sleep(0.35)
+    faults.latency = 0.0
+    run(dependency.call(faults))
+    assert faults.calls == 2
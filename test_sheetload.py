@@ -0,0 +1,49 @@
+"""Постраничная загрузка листа: python -m pytest -q"""
+from fakes import FakeWorksheet, sample_records
+from sheetload import WorksheetReader, read_worksheet
+
+
+class TrimmedWorksheet(FakeWorksheet):
+    """Лист с пустыми строками в конце первой страницы: API возвращает её короче запрошенного"""
+
+    def __init__(self, records, blank_rows, row_count=None):
+        super().__init__(records)
+        self.blank_rows = blank_rows
+        self.ranges = []
+        if row_count is not None:
+            self.row_count = row_count
+
+    def get_values(self, range_name):
+        self.ranges.append(range_name)
+        first, last = (int(x) for x in range_name.split(':'))
+        values = super().get_values(range_name)
+        if first == 2:
+            values = values[:len(values) - self.blank_rows]
+        return values
+
+
+def test_short_page_is_not_the_end():
+    sheet = TrimmedWorksheet(sample_records(250), blank_rows=10)
+    df = read_worksheet(sheet, batch_rows=100)
+    assert len(df) == 240
+    assert sheet.ranges[-1] == '302:401'
+
+
+def test_row_count_stops_without_extra_request():
+    sheet = TrimmedWorksheet(sample_records(250), blank_rows=0, row_count=251)
+    df = read_worksheet(sheet, batch_rows=100)
+    assert len(df) == 250
+    assert sheet.ranges == ['1:1', '2:101', '102:201', '202:301']
+
+
+def test_reader_steps_match_single_call():
+    records = sample_records(120)
+    sheet = FakeWorksheet(records)
+    reader = WorksheetReader(batch_rows=50)
+    while (cell_range := reader.next_range()) is not None:
+        reader.add(sheet.get_values(cell_range))
+    assert reader.build().equals(read_worksheet(sheet, batch_rows=50))
+
+
+def test_empty_sheet():
+    assert read_worksheet(FakeWorksheet([]), batch_rows=50).empty
@@ -0,0 +1,115 @@
+"""Индекс динамики: суммы и количества по дням для каждой метрики опроса.
+
+Индекс строится по колонке времени, распарсенной при загрузке снимка. Google Forms
+дописывает ответы в конец таблицы, поэтому при обновлении снимка в индекс
+добавляются только новые строки. Правки уже учтённых строк ловит отпечаток
+последних FINGERPRINT_ROWS из них, а правки в глубине таблицы - полный пересчёт
+раз в REBUILD_EVERY обновлений. Недельные ряды собираются из дневных корзин.
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+TIMESTAMP_COLUMN = 'Отметка времени'
+FINGERPRINT_ROWS = 1000
+REBUILD_EVERY = 20
+
+
+def rate_metric(column, positive):
+    """Доля положительных ответов: 1/0 по строке, NaN если ответа нет"""
+    def values(df):
+        answers = df[column]
+        return np.where(answers.isna(), np.nan, answers.isin(positive).astype(float))
+    values.columns = [column]
+    return values
+
+
+def mean_metric(*metrics):
+    """Среднее нескольких метрик по строке (например, общая удовлетворенность)"""
+    def values(df):
+        parts = [m(df) for m in metrics if set(m.columns) <= set(df.columns)]
+        if not parts:
+            return np.full(len(df), np.nan)
+        with np.errstate(invalid='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # строки без единого ответа -> NaN
+            return np.nanmean(np.vstack(parts), axis=0)
+    values.columns = []
+    return values
+
+
+def minutes_metric(column):
+    """Оценка в минутах: среднее чисел в ответе ('5-10 минут' -> 7.5, 'Менее 5 минут' -> 5)"""
+    def values(df):
+        answers = df[column].astype(str)
+        numbers = answers.str.extractall(r'(\d+)')[0].astype(float).groupby(level=0).mean()
+        return numbers.reindex(range(len(df))).to_numpy()
+    values.columns = [column]
+    return values
+
+
+def _fingerprint(df, rows):
+    """Хэш последних FINGERPRINT_ROWS строк из первых rows"""
+    tail = df.iloc[max(0, rows - FINGERPRINT_ROWS):rows]
+    return int(pd.util.hash_pandas_object(tail, index=False).sum()) if len(tail) else None
+
+
+class TrendIndex:
+    """Дневные корзины: sums/counts - DataFrame (день x метрика)"""
+
+    incremental = True
+
+    def __init__(self, metrics, sums=None, counts=None, rows=0, fingerprint=None, refreshes=0):
+        self.metrics = metrics
+        empty = pd.DataFrame(columns=list(metrics), index=pd.DatetimeIndex([]), dtype=float)
+        self.sums = sums if sums is not None else empty
+        self.counts = counts if counts is not None else empty
+        self.rows = rows
+        self.fingerprint = fingerprint
+        self.refreshes = refreshes
+
+    @property
+    def nbytes(self):
+        return int(self.sums.memory_usage().sum() + self.counts.memory_usage().sum())
+
+    def refresh(self, df):
+        """Новый индекс по df: дописываем только строки после self.rows, если начало таблицы не менялось"""
+        if TIMESTAMP_COLUMN not in df.columns:
+            return TrendIndex(self.metrics)
+        start = self.rows
+        if (start > len(df) or self.refreshes + 1 >= REBUILD_EVERY
+                or (start and _fingerprint(df, start) != self.fingerprint)):
+            start = 0  # строки удалили, переставили или исправили - пересчитываем целиком
+        base = self if start else TrendIndex(self.metrics)
+        tail = df.iloc[start:].reset_index(drop=True)
+        sums, counts = base.sums, base.counts
+        if len(tail):
+            days = tail[TIMESTAMP_COLUMN].dt.normalize()
+            values = pd.DataFrame({
+                name: metric(tail) for name, metric in self.metrics.items()
+                if set(metric.columns) <= set(tail.columns)
+            })
+            values['day'] = days.to_numpy()
+            values = values.dropna(subset=['day'])
+            grouped = values.groupby('day')
+            sums = sums.add(grouped.sum(), fill_value=0)
+            counts = counts.add(grouped.count(), fill_value=0)
+        return TrendIndex(self.metrics, sums.sort_index(), counts.sort_index(), len(df),
+                          _fingerprint(df, len(df)), base.refreshes + 1 if start else 0)
+
+    def series(self, metric, days=None, freq='D'):
+        """Ряд значений метрики по дням ('D') или неделям ('W') за последние days дней данных
+
+        Окно отсчитывается от дня последней анкеты, а не от сегодняшнего: если опрос
+        давно не пополнялся, «за неделю» - это последняя неделя с ответами.
+        """
+        if metric not in self.sums.columns or self.sums.empty:
+            return pd.Series(dtype=float), pd.Series(dtype=float)
+        sums, counts = self.sums[metric], self.counts[metric]
+        if days is not None:
+            since = sums.index.max() - pd.Timedelta(days=days - 1)
+            sums, counts = sums[sums.index >= since], counts[counts.index >= since]
+        if freq != 'D':
+            sums, counts = sums.resample(freq).sum(), counts.resample(freq).sum()
+        counts = counts[counts > 0]
+        return (sums[counts.index] / counts), counts